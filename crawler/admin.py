@@ -13,6 +13,12 @@ class DeckCrawlResultAdmin(admin.ModelAdmin):
     list_filter = ['fetchable', 'got_cards']
 
 
+class BulkDataFetchAdmin(admin.ModelAdmin):
+    date_hierarchy = 'ingested_time'
+    list_display = ['bulk_type', 'updated_at', 'size', 'ingested_time']
+    list_filter = ['bulk_type']
+
+
 class LogStartAdmin(admin.ModelAdmin):
     date_hierarchy = 'created'
     readonly_fields = ['text']
@@ -29,5 +35,6 @@ class LogEntryAdmin(admin.ModelAdmin):
 admin.site.register(models.CrawlRun, CrawlRunAdmin)
 # this would be a nice inline if it were paginated
 admin.site.register(models.DeckCrawlResult, DeckCrawlResultAdmin)
+admin.site.register(models.BulkDataFetch, BulkDataFetchAdmin)
 admin.site.register(models.LogStart, LogStartAdmin)
 admin.site.register(models.LogEntry, LogEntryAdmin)
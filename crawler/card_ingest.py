@@ -0,0 +1,380 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+
+from django.db import connection, transaction
+from django.db.utils import DataError
+
+from decklist.models import Card, Printing
+from crawler.card_parse_worker import parse_chunk
+from crawler.worker_pool import DEFAULT_WORKERS, run_chunks
+
+
+# fields we own during ingest; notably, `editorial_printing` is
+# curated by hand and must never be overwritten by a Scryfall refresh.
+# `default_printing` and `image_uri` are derived after ingest.
+CARD_UPDATE_FIELDS = [
+    'name',
+    'identity_w',
+    'identity_u',
+    'identity_b',
+    'identity_r',
+    'identity_g',
+    'type_line',
+    'subtypes',
+    'keywords',
+    'scryfall_uri',
+    'partner_type',
+]
+# Scryfall hands us a card once per printing, and these differ between
+# printings of the same card. They're still written along with the card,
+# but leaving them out of its hash keeps the card from looking changed
+# every time a different printing comes along.
+CARD_PRINTING_SPECIFIC_FIELDS = [
+    'scryfall_uri',
+]
+CARD_HASH_FIELDS = [f for f in CARD_UPDATE_FIELDS if f not in CARD_PRINTING_SPECIFIC_FIELDS]
+PRINTING_UPDATE_FIELDS = [
+    'card',
+    'set_code',
+    'rarity',
+    'image_uri',
+    'is_highres',
+    'is_paper',
+    'release_date',
+]
+
+DEFAULT_BATCH_SIZE = 1000
+PARSE_CHUNK_SIZE = 500
+
+
+def content_hash(obj, fields):
+    "Stable hash of the given fields of a model instance"
+    values = list(_field_values(obj, fields).values())
+    serialized = json.dumps(values, default=str, ensure_ascii=False)
+    return hashlib.blake2b(serialized.encode(), digest_size=16).hexdigest()
+
+
+def prepare_for_write(card: Card, printing: Printing):
+    if len(card.name) > 100:
+        # Market Research Elemental 🙄
+        card.name = card.name[:47] + '...'
+    card.content_hash = content_hash(card, CARD_HASH_FIELDS)
+    printing.content_hash = content_hash(printing, PRINTING_UPDATE_FIELDS)
+
+
+def to_record(card: Card, printing: Printing):
+    "Flatten a parsed card and printing into plain, picklable dicts"
+    return (
+        _field_values(card, ['id', 'content_hash'] + CARD_UPDATE_FIELDS),
+        _field_values(printing, ['id', 'content_hash'] + PRINTING_UPDATE_FIELDS),
+    )
+
+
+def _field_values(obj, fields):
+    return {
+        attname: getattr(obj, attname)
+        for attname in (obj._meta.get_field(f).attname for f in fields)
+    }
+
+
+def from_record(record):
+    card_fields, printing_fields = record
+    card = Card(**card_fields)
+    printing = Printing(**printing_fields)
+    printing.card = card
+    return card, printing
+
+
+class CardBatchWriter:
+    """Buffers parsed cards and printings and upserts them in chunks.
+
+    Scryfall's bulk file has one entry per printing, so the same card
+    shows up many times. Within a batch, the last card seen wins, which
+    matches what per-row saves used to do. Rows whose content hash
+    matches what's already stored are not rewritten."""
+
+    def __init__(self, log, err, batch_size=DEFAULT_BATCH_SIZE):
+        self._log = log
+        self._err = err
+        self.batch_size = batch_size
+        self._cards = {}
+        self._printings = {}
+        # card ID -> hash of the version we've already queued this run
+        self._queued_card_hashes = {}
+        # cards which failed to write; their printings are skipped for
+        # the rest of the run, since they'd have no card to point at
+        self._bad_cards = set()
+        self.stats = {
+            model: {'inserted': 0, 'updated': 0, 'unchanged': 0}
+            for model in (Card, Printing)
+        }
+        self.write_seconds = 0.0
+
+    def add(self, card: Card, printing: Printing):
+        prepare_for_write(card, printing)
+        self._enqueue(card, printing)
+
+    def add_record(self, record):
+        "Add a card and printing which came from `to_record`"
+        self._enqueue(*from_record(record))
+
+    def _enqueue(self, card: Card, printing: Printing):
+        if card.id in self._bad_cards:
+            return
+
+        # most cards have many printings; don't check the same card
+        # against the database over and over
+        if self._queued_card_hashes.get(card.id) != card.content_hash:
+            self._queued_card_hashes[card.id] = card.content_hash
+            self._cards[card.id] = card
+        self._printings[printing.id] = printing
+
+        if len(self._printings) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._printings and not self._cards:
+            return
+
+        start = time.perf_counter()
+        cards = self._changed_rows(Card, self._cards)
+        printings = self._changed_rows(Printing, self._printings)
+        self._cards = {}
+        self._printings = {}
+
+        try:
+            with transaction.atomic():
+                self._upsert(cards, printings)
+        except DataError as e:
+            # one bad row spoils the whole statement, so find the culprit(s)
+            # the slow way and keep the rest of the batch
+            self._err(f"Batch of {len(printings)} printings threw {e}; retrying row by row")
+            self._upsert_one_by_one(cards, printings)
+
+        self.write_seconds += time.perf_counter() - start
+
+    @property
+    def rows_seen(self):
+        return sum(sum(counts.values()) for counts in self.stats.values())
+
+    @property
+    def rows_written(self):
+        return sum(
+            counts['inserted'] + counts['updated']
+            for counts in self.stats.values()
+        )
+
+    def rows_per_second(self):
+        if self.write_seconds == 0:
+            return 0.0
+        return self.rows_seen / self.write_seconds
+
+    def summary(self):
+        return "; ".join(
+            f"{model._meta.verbose_name_plural}: "
+            f"{counts['inserted']} inserted, {counts['updated']} updated, "
+            f"{counts['unchanged']} unchanged"
+            for model, counts in self.stats.items()
+        )
+
+    def _changed_rows(self, model, pending):
+        # parsed IDs are strings, stored ones are UUIDs
+        stored_hashes = {
+            str(row_id): stored_hash
+            for row_id, stored_hash in (
+                model.objects
+                .filter(id__in=pending.keys())
+                .values_list('id', 'content_hash')
+            )
+        }
+        counts = self.stats[model]
+        changed = []
+        for row_id, row in pending.items():
+            row_id = str(row_id)
+            if row_id not in stored_hashes:
+                counts['inserted'] += 1
+                changed.append(row)
+            elif stored_hashes[row_id] != row.content_hash:
+                counts['updated'] += 1
+                changed.append(row)
+            else:
+                counts['unchanged'] += 1
+        return changed
+
+    def _upsert(self, cards, printings):
+        Card.objects.bulk_create(
+            cards,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=CARD_UPDATE_FIELDS + ['content_hash'],
+        )
+        Printing.objects.bulk_create(
+            printings,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=PRINTING_UPDATE_FIELDS + ['content_hash'],
+        )
+
+    def _upsert_one_by_one(self, cards, printings):
+        for c in cards:
+            try:
+                with transaction.atomic():
+                    self._upsert([c], [])
+            except DataError as e:
+                self._bad_cards.add(c.id)
+                self._log(f"Card {c.name} threw {e}")
+
+        for p in printings:
+            if p.card_id in self._bad_cards:
+                continue
+            try:
+                with transaction.atomic():
+                    self._upsert([], [p])
+            except DataError as e:
+                self._log(f"Printing {p} threw {e}")
+
+
+class _StageTimer:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def report(self):
+        rate = self.items / self.busy_seconds if self.busy_seconds else 0.0
+        return f"{self.name}: {self.items} in {self.busy_seconds:.1f}s busy ({rate:.0f}/sec)"
+
+
+class IngestPipeline:
+    """Read -> parse -> write pipeline for Scryfall card data.
+
+    The caller's iterable is the reader stage and runs on the calling
+    thread. It hands chunks of card dicts to a pool of parse processes,
+    and parsed records go to a single writer thread. The number of chunks
+    in flight and the writer's queue are both bounded, so a slow stage
+    makes the others wait instead of piling up memory.
+
+    With `workers=0`, everything runs inline on the calling thread."""
+
+    def __init__(self, writer: CardBatchWriter, err, workers=DEFAULT_WORKERS, chunk_size=PARSE_CHUNK_SIZE):
+        self.writer = writer
+        self._err = err
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.read_stage = _StageTimer('read')
+        self.parse_stage = _StageTimer('parse (summed across workers)')
+        self.write_stage = _StageTimer('write')
+
+    def run(self, json_cards):
+        if self.workers == 0:
+            self._run_inline(json_cards)
+        else:
+            self._run_parallel(json_cards)
+
+    def report(self):
+        return [
+            self.read_stage.report(),
+            self.parse_stage.report(),
+            self.write_stage.report(),
+        ]
+
+    def _read_chunks(self, json_cards):
+        chunk = []
+        iterator = iter(json_cards)
+        done = object()
+        while True:
+            start = time.perf_counter()
+            json_card = next(iterator, done)
+            self.read_stage.busy_seconds += time.perf_counter() - start
+            if json_card is done:
+                break
+
+            self.read_stage.items += 1
+            chunk.append(json_card)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def _run_inline(self, json_cards):
+        for chunk in self._read_chunks(json_cards):
+            self._write(self._collect(parse_chunk(chunk)))
+        self._flush()
+
+    def _run_parallel(self, json_cards):
+        max_in_flight = self.workers * 2
+        write_queue = queue.Queue(maxsize=max_in_flight)
+        writer_errors = []
+        writer_thread = threading.Thread(
+            target=self._write_from_queue,
+            args=(write_queue, writer_errors),
+            name='card-writer',
+        )
+        writer_thread.start()
+
+        try:
+            for parsed in run_chunks(parse_chunk, self._read_chunks(json_cards), self.workers):
+                self._put(write_queue, parsed, writer_errors)
+        finally:
+            # tell the writer we're done, even if we're bailing out
+            write_queue.put(None)
+            writer_thread.join()
+
+        if writer_errors:
+            raise writer_errors[0]
+
+    def _put(self, write_queue, parsed, writer_errors):
+        records = self._collect(parsed)
+        while not writer_errors:
+            try:
+                write_queue.put(records, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise writer_errors[0]
+
+    def _write_from_queue(self, write_queue, writer_errors):
+        try:
+            while (records := write_queue.get()) is not None:
+                if writer_errors:
+                    # keep draining so the reader can reach the end
+                    continue
+                try:
+                    self._write(records)
+                except Exception as e:
+                    writer_errors.append(e)
+
+            if not writer_errors:
+                self._flush()
+        except Exception as e:
+            writer_errors.append(e)
+        finally:
+            # this thread had its own database connection
+            connection.close()
+
+    def _collect(self, parsed):
+        records, failures, seconds = parsed
+        for name, parse_failures in failures:
+            self._err(f"failed to parse {name}")
+            for k, v in parse_failures.items():
+                self._err(f".. {k}: {v}")
+        self.parse_stage.items += len(records) + len(failures)
+        self.parse_stage.busy_seconds += seconds
+        return records
+
+    def _write(self, records):
+        start = time.perf_counter()
+        for record in records:
+            self.writer.add_record(record)
+        self.write_stage.items += len(records)
+        self.write_stage.busy_seconds += time.perf_counter() - start
+
+    def _flush(self):
+        start = time.perf_counter()
+        self.writer.flush()
+        self.write_stage.busy_seconds += time.perf_counter() - start
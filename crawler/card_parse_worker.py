@@ -0,0 +1,39 @@
+"""
+Work done in fetch-cards' parse worker processes; see crawler.worker_pool.
+"""
+import json
+import time
+
+
+def parse_chunk(json_cards):
+    """Parse a list of Scryfall cards into plain records.
+
+    Cards may be dicts or undecoded JSON text. Returns (records, failures,
+    seconds spent parsing); unwanted cards are in neither list."""
+    from crawler.card_parsing import is_wanted_card, parse_card_and_printing, FailedToParseCard
+    from crawler.card_ingest import prepare_for_write, to_record
+
+    start = time.perf_counter()
+    records = []
+    failures = []
+    for json_card in json_cards:
+        if isinstance(json_card, (bytes, str)):
+            try:
+                json_card = json.loads(json_card)
+            except json.JSONDecodeError as e:
+                failures.append(('(unreadable JSON)', {'json': str(e)}))
+                continue
+
+        if not is_wanted_card(json_card):
+            continue
+
+        try:
+            c, p = parse_card_and_printing(json_card)
+        except FailedToParseCard as e:
+            failures.append((json_card.get('name'), e.args[0]))
+            continue
+
+        prepare_for_write(c, p)
+        records.append(to_record(c, p))
+
+    return records, failures, time.perf_counter() - start
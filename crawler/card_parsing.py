@@ -7,6 +7,29 @@ class ParseFailure(Exception): ...
 class FailedToParseCard(Exception): ...
 
 
+def is_wanted_card(json_card):
+    # we want to exclude some non-playable cards but aren't entirely
+    # beholden to upstream's record of format legalities
+    if 'layout' in json_card and json_card['layout'] in (
+        'planar', 'scheme', 'vanguard', 'token', 'double_faced_token',
+        'emblem', 'art_series', 'reversible_card',
+    ):
+        return False
+
+    return True
+
+
+def parse_subtypes(type_line):
+    "Subtypes from every face of a type line, e.g. 'Creature — Human Druid' -> ['Human', 'Druid']"
+    subtypes = []
+    for face in type_line.split(' // '):
+        _, _, after_dash = face.partition('—')
+        for subtype in after_dash.split():
+            if subtype not in subtypes:
+                subtypes.append(subtype)
+    return subtypes
+
+
 def parse_card_and_printing(json_card):
     parse_failures = {}
     for parse in [_extract_card_and_printing, _extract_verhey_card_and_printing]:
@@ -33,6 +56,7 @@ def _extract_card_and_printing(json_card):
             identity_r="R" in json_card['color_identity'],
             identity_g="G" in json_card['color_identity'],
             type_line=json_card['type_line'],
+            subtypes=parse_subtypes(json_card['type_line']),
             keywords=list(json_card['keywords']),
             scryfall_uri=json_card['scryfall_uri'],
         )
@@ -95,6 +119,7 @@ def _extract_verhey_card_and_printing(json_card):
                 identity_r="R" in json_card['color_identity'],
                 identity_g="G" in json_card['color_identity'],
                 type_line=face['type_line'],
+                subtypes=parse_subtypes(face['type_line']),
                 keywords=list(json_card['keywords']),
                 scryfall_uri=json_card['scryfall_uri'],
             )
@@ -0,0 +1,86 @@
+import threading
+import uuid
+
+from decklist.models import Printing
+
+
+class CardNotFound(Exception): ...
+
+
+class PrintingResolver:
+    """Resolves the printings in a fetched decklist to card IDs.
+
+    Loads every printing once, so resolving a deck doesn't need any
+    queries. Printing IDs are kept as raw bytes and card IDs are shared
+    between all of a card's printings, which keeps the maps small.
+    Lookups are safe to make from several threads."""
+
+    # HACK:
+    # cards with set_code `j21` often don't resolve
+    # so we relax the restriction and try again
+    # likewise, the `rex` lands don't resolve, so also
+    # relax and try again.
+    NAME_ONLY_SETS = frozenset(('j21', 'rex'))
+
+    def __init__(self):
+        self._card_by_printing = {}
+        self._card_by_name_and_set = {}
+        self._card_by_name = {}
+        self.printing_hits = 0
+        self.name_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        card_ids = {}
+        rows = (
+            Printing.objects
+            .values_list('id', 'card_id', 'card__name', 'set_code')
+            .iterator(chunk_size=5000)
+        )
+        for printing_id, card_id, name, set_code in rows:
+            card_id = card_ids.setdefault(card_id, card_id)
+            name = name.lower()
+            self._card_by_printing[printing_id.bytes] = card_id
+            self._card_by_name_and_set.setdefault((name, set_code.lower()), card_id)
+            self._card_by_name.setdefault(name, card_id)
+
+    def __len__(self):
+        return len(self._card_by_printing)
+
+    def card_for_printing(self, printing_id):
+        "Card ID for a Scryfall printing ID, or None if we don't know it"
+        try:
+            key = uuid.UUID(printing_id).bytes
+        except (TypeError, ValueError):
+            key = None
+
+        card_id = self._card_by_printing.get(key)
+        if card_id is not None:
+            with self._stats_lock:
+                self.printing_hits += 1
+        return card_id
+
+    def lookup_card(self, name, set_code):
+        "Card ID by name and set, for printings we don't know"
+        key_name, key_set = name.lower(), set_code.lower()
+        card_id = self._card_by_name_and_set.get((key_name, key_set))
+        if card_id is None and key_set in self.NAME_ONLY_SETS:
+            card_id = self._card_by_name.get(key_name)
+
+        with self._stats_lock:
+            if card_id is None:
+                self.misses += 1
+            else:
+                self.name_hits += 1
+
+        if card_id is None:
+            raise CardNotFound(f'"{name}" ({set_code})')
+        return card_id
+
+    def report(self):
+        return (
+            f"Resolved {self.printing_hits} cards by printing, "
+            f"{self.name_hits} by name and set; {self.misses} not found"
+        )
@@ -0,0 +1,129 @@
+import httpx
+from django.utils import timezone
+
+from decklist.models import Deck
+from crawler.models import CrawlRun
+from crawler.crawlers import CrawlerExit, format_response_error
+
+
+class CrawlRunner:
+    """Runs a search crawl for one source, checkpointing its progress
+    in a `CrawlRun` so an interrupted crawl picks up where it left off.
+
+    `echo` and `echo_err` get the request-by-request chatter, which
+    isn't worth keeping in the database log."""
+
+    def __init__(self, crawler_class, headers, log, err, echo=print, echo_err=print):
+        self.crawler_class = crawler_class
+        self.headers = headers
+        self._log = log
+        self._err = err
+        self._echo = echo
+        self._echo_err = echo_err
+        self.crawler = None
+        self.error_text = None
+
+    def run(self):
+        """Crawl until we're caught up. If the crawler has to stop early,
+        records why and re-raises its CrawlerExit."""
+        datasource = self.crawler_class.DATASOURCE
+        stop_after = self._compute_stop_after(datasource)
+        run = self._get_or_create_run(datasource, stop_after)
+
+        self._log(f"Starting run {run}")
+
+        with self._create_client() as client:
+            crawler = self.crawler = self.crawler_class(
+                client,
+                run.next_fetch,
+                stop_after,
+                self._log,
+            )
+
+            run.state = CrawlRun.State.FETCHING_DECKS
+            run.save()
+
+            try:
+                # the crawler paces itself against the host's rate limit
+                while crawler.get_next_page():
+                    run.next_fetch = crawler.url
+                    run.save()
+
+            except CrawlerExit as e:
+                self.error_text = (
+                    format_response_error(e.response) if e.response
+                    else str(e)
+                )
+                if not e.transient:
+                    run.state = CrawlRun.State.ERROR
+                # otherwise, we ran out of retries; leave the run in progress
+                # so the next crawl resumes from the last page we got
+                run.note = self.error_text
+                run.save()
+                self._err(self.error_text)
+                raise
+
+        # if we got here without exiting, we're done
+        self._log(crawler.report())
+        self._log("Done!")
+        run.state = CrawlRun.State.COMPLETE
+        run.save()
+
+    def _create_client(self):
+        return httpx.Client(
+            headers=self.headers,
+            base_url=self.crawler_class.API_BASE,
+            event_hooks={
+                'request': [self._request_log],
+                'response': [self._response_log],
+            })
+
+    def _compute_stop_after(self, datasource):
+        try:
+            latest_deck_update = (
+                Deck.objects
+                .filter(
+                    source=datasource,
+                    updated_time__isnull=False,
+                )
+                .latest('updated_time')
+            ).updated_time
+        except Deck.DoesNotExist:
+            latest_deck_update = None
+
+        return latest_deck_update
+
+    def _get_or_create_run(self, datasource, stop_after):
+        # try to resume an existing run
+        try:
+            run = CrawlRun.objects.filter(
+                target=datasource,
+                state__in=(
+                    CrawlRun.State.NOT_STARTED,
+                    CrawlRun.State.FETCHING_DECKS,
+                )
+            ).latest('crawl_start_time')
+        except CrawlRun.DoesNotExist:
+            run = CrawlRun(
+                crawl_start_time=timezone.now(),
+                target=datasource,
+                state=CrawlRun.State.NOT_STARTED,
+                search_back_to=stop_after,
+            )
+            run.save()
+
+        return run
+
+    def _request_log(self, request):
+        self._echo(f">> {request.method} {request.url}")
+
+    def _response_log(self, response):
+        request = response.request
+        self._echo(f"<< {request.method} {request.url} {response.status_code}")
+        if response.status_code >= 400:
+            response.read()
+            for hdr, value in response.headers.items():
+                self._echo_err(f".. {hdr}: {value}")
+            self._echo_err("")
+            self._echo_err(response.text)
+            self._echo_err("--------")
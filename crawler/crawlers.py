@@ -1,9 +1,14 @@
+import time
+from itertools import chain
+from urllib.parse import urlparse
+from django.conf import settings
 import httpx
 from smallformats import __version__
 from decklist.models import DataSource, Deck
 from crawler.models import DeckCrawlResult
 from django.utils.dateparse import parse_datetime
 from django.db import transaction
+from crawler.throttling import RequestFailed, is_transient, throttle_for_host
 
 ARCHIDEKT_API_BASE = "https://archidekt.com/api/"
 MOXFIELD_API_BASE = "https://api2.moxfield.com/v2/"
@@ -15,6 +20,15 @@ HEADERS = {
     'Accept': 'application/json;q=0.9,*/*;q=0.8',
 }
 
+# Moxfield identifies API users by user-agent
+if settings.MOXFIELD_API_KEY:
+    MOXFIELD_HEADERS = HEADERS.copy()
+    MOXFIELD_HEADERS.update({
+        'User-agent': settings.MOXFIELD_API_KEY,
+    })
+else:
+    MOXFIELD_HEADERS = None
+
 
 def format_response_error(response):
     result = f"{response.status_code} accessing {response.request.url}\n\n"
@@ -26,9 +40,11 @@ def format_response_error(response):
 
 
 class CrawlerExit(Exception):
-    def __init__(self, *args, response: httpx.Response = None):
+    def __init__(self, *args, response: httpx.Response = None, transient=False):
         super().__init__(*args)
         self.response = response
+        # transient exits may go away if we try again later
+        self.transient = transient
 
 
 class _BaseCrawler:
@@ -45,12 +61,23 @@ class _BaseCrawler:
     CREATOR_DISPLAY_KEY_1 = None
     CREATOR_DISPLAY_KEY_2 = None
 
+    DECK_UPDATE_FIELDS = [
+        'name',
+        'source_link',
+        'creator_display_name',
+        'updated_time',
+    ]
+
     def __init__(self, client: httpx.Client, initial_url, stop_after, write):
         self.stop_after = stop_after
         self._client = client
+        self._throttle = throttle_for_host(urlparse(self.API_BASE).hostname)
         self._write = write or print
         self.url = initial_url or self._build_initial_url()
         self._keep_going = True
+        self.decks_written = 0
+        self.decks_unchanged = 0
+        self.write_seconds = 0.0
     
     def _build_initial_url(self):
         req = self._client.build_request(
@@ -64,13 +91,21 @@ class _BaseCrawler:
         if not self._keep_going:
             raise CrawlerExit("this crawler cannot proceed")
 
-        response = self._client.get(self.url)
+        try:
+            response, _ = self._throttle.request(lambda: self._client.get(self.url))
+        except RequestFailed as e:
+            self._keep_going = False
+            raise CrawlerExit(str(e), transient=True) from e
 
         # check errors
         if response.status_code < 200 or response.status_code >= 300:
             # report error and bail
             self._keep_going = False
-            raise CrawlerExit(f"got {response.status_code} from client", response)
+            raise CrawlerExit(
+                f"got {response.status_code} from client",
+                response=response,
+                transient=is_transient(response),
+            )
         
         else:
             self._process_response(response)
@@ -82,6 +117,7 @@ class _BaseCrawler:
     
     def _process_page(self, results, stop_after):
         self._write(f"Processing next {len(results)} results.")
+        start = time.perf_counter()
         
         # get existing decks for this page
         ids = [str(r[self.ID_KEY]) for r in results]
@@ -90,40 +126,83 @@ class _BaseCrawler:
         ).filter(source_id__in=ids)
         existing_decks = { d.source_id: d for d in qs }
 
+        new_decks = {}
+        updated_decks = {}
+        unchanged_count = 0
+        deck_updated_at = None
         for deck_data in results:
             deck_updated_at = parse_datetime(deck_data[self.LAST_UPDATE_KEY])
             if stop_after and deck_updated_at < stop_after:
-                # break if we've seen everything back to the right time
-                return deck_updated_at
+                # stop if we've seen everything back to the right time
+                break
 
             this_id = str(deck_data[self.ID_KEY])
+            if this_id in new_decks or this_id in updated_decks:
+                # listed twice on one page; the first one is newest
+                continue
+
+            name = deck_data[self.NAME_KEY]
+            # so far, both Archidekt and Moxfield have a fixed 2-level hierarchy
+            creator_display_name = deck_data[self.CREATOR_DISPLAY_KEY_1][self.CREATOR_DISPLAY_KEY_2]
+
             if this_id in existing_decks.keys():
                 deck = existing_decks[this_id]
-                deck.commander = None # reset commander in case it changed
+                if (
+                    deck.name == name
+                    and deck.creator_display_name == creator_display_name
+                    and deck.updated_time == deck_updated_at
+                ):
+                    # nothing new since we last saw it
+                    unchanged_count += 1
+                    continue
+                # leave the commander alone; fetching the decklist
+                # works it out again if the cards changed
+                updated_decks[this_id] = deck
             else:
                 deck = Deck()
                 deck.pdh_legal = False # until proven otherwise!
-            deck.name = deck_data[self.NAME_KEY]
+                new_decks[this_id] = deck
+            deck.name = name
             deck.source = self.DATASOURCE
             deck.source_id = this_id
             deck.source_link = self.SOURCE_LINK.format(this_id)
-            # so far, both Archidekt and Moxfield have a fixed 2-level hierarchy
-            deck.creator_display_name = deck_data[self.CREATOR_DISPLAY_KEY_1][self.CREATOR_DISPLAY_KEY_2]
+            deck.creator_display_name = creator_display_name
             deck.updated_time = deck_updated_at
 
-            crawl_result = DeckCrawlResult(
-                url=self.DECK_FETCH_LINK.format(this_id),
-                deck=deck,
-                updated_time=deck_updated_at,
-                got_cards=False,
-            )
-            with transaction.atomic():
-                deck.save()
-                crawl_result.save()
+        with transaction.atomic():
+            Deck.objects.bulk_create(new_decks.values())
+            Deck.objects.bulk_update(updated_decks.values(), self.DECK_UPDATE_FIELDS)
+            DeckCrawlResult.objects.enqueue([
+                DeckCrawlResult(
+                    url=self.DECK_FETCH_LINK.format(deck.source_id),
+                    deck=deck,
+                    updated_time=deck.updated_time,
+                    got_cards=False,
+                )
+                for deck in chain(new_decks.values(), updated_decks.values())
+            ])
+
+        elapsed = time.perf_counter() - start
+        written = len(new_decks) + len(updated_decks)
+        self.decks_written += written
+        self.decks_unchanged += unchanged_count
+        self.write_seconds += elapsed
+        self._write(
+            f"Wrote {len(new_decks)} new and {len(updated_decks)} updated decks, "
+            f"skipped {unchanged_count} unchanged, in {elapsed:.2f}s "
+            f"({written / elapsed:.0f} decks/sec)"
+        )
         
-        # the last deck we processed will have the oldest date
+        # the last deck we looked at will have the oldest date
         return deck_updated_at
 
+    def report(self):
+        rate = self.decks_written / self.write_seconds if self.write_seconds else 0.0
+        return (
+            f"Wrote {self.decks_written} decks and skipped {self.decks_unchanged} "
+            f"unchanged in {self.write_seconds:.1f}s ({rate:.0f} decks/sec)"
+        )
+
 
 class ArchidektCrawler(_BaseCrawler):
     API_BASE = ARCHIDEKT_API_BASE
@@ -150,7 +229,7 @@ class ArchidektCrawler(_BaseCrawler):
         # Archidekt seems to send "count = -1" under some conditions
         if count <= 0:
             self._keep_going = False
-            raise CrawlerExit(f"Archidekt client got: {response.text}", response)
+            raise CrawlerExit(f"Archidekt client got: {response.text}", response=response)
 
         if next:
             # Archidekt "next" comes back as http:// so fix that up
@@ -202,7 +281,7 @@ class MoxfieldCrawler(_BaseCrawler):
 
         if count <= 0:
             self._keep_going = False
-            raise CrawlerExit(f"Moxfield client got: {response.text}", response)
+            raise CrawlerExit(f"Moxfield client got: {response.text}", response=response)
 
         oldest_seen = self._process_page(envelope['data'], self.stop_after)
         if self.stop_after and oldest_seen < self.stop_after:
@@ -0,0 +1,470 @@
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from django.db import connections, transaction
+from django.utils import timezone
+import httpx
+
+from decklist.models import DataSource, CardInDeck, Commander
+from decklist.models.deck import card_fingerprint
+from decklist.legality import LegalityChecker
+from crawler.card_resolver import PrintingResolver, CardNotFound
+from crawler.crawlers import HEADERS, MOXFIELD_HEADERS
+from crawler.models import DeckCrawlResult
+from crawler.throttling import (
+    HOST_LIMITS,
+    DEFAULT_HOST_LIMITS,
+    CircuitOpen,
+    RequestFailed,
+    is_transient,
+    throttle_for_host,
+)
+
+if not MOXFIELD_HEADERS:
+    # TODO: make this a real warning
+    print("Moxfield API key missing; will not fetch decklists from Moxfield")
+
+# decks are claimed from the queue a few at a time, and if they
+# haven't been fetched by the time the lease runs out, anyone can
+# have them. keep batches small enough to fetch well within the lease.
+CLAIM_BATCH_SIZE = 50
+LEASE_TIME = timedelta(minutes=10)
+# threads applying fetched decklists to the database
+DB_WORKERS = 2
+# a host whose circuit breaker trips this many times in one run is
+# left alone for the rest of it; until then, we wait out the cooldown
+MAX_BREAKER_TRIPS = 3
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.idle_seconds = 0.0
+
+    def report(self):
+        total = self.busy_seconds + self.idle_seconds
+        busy_percent = 100 * self.busy_seconds / total if total else 0.0
+        return (
+            f"{self.name}: {self.items} decks, busy {self.busy_seconds:.1f}s, "
+            f"idle {self.idle_seconds:.1f}s ({busy_percent:.0f}% busy)"
+        )
+
+
+class DecklistFetcher:
+    """Fetches and stores the decklists for a batch of `DeckCrawlResult`s.
+
+    Requests go out concurrently, within each host's limits, on an
+    asyncio event loop, and transient failures are retried. Fetched
+    decklists go through a bounded queue to `db_workers` threads, which
+    do all the database work, so the network and the database are both
+    kept busy.
+
+    `run_queue()` takes its decks from the shared queue, so several
+    fetchers can work through it at once."""
+
+    def __init__(self, log, err, db_workers=DB_WORKERS):
+        self._log = log
+        self._err = err
+        self.db_workers = db_workers
+        self._resolver = PrintingResolver()
+        self._log(f"Loaded {len(self._resolver)} known printings")
+        self._legality = LegalityChecker()
+        # (commander1 ID, commander2 ID) -> Commander ID
+        self._commanders = {
+            (card1, card2): cmdr_id
+            for card1, card2, cmdr_id in Commander.objects.values_list('commander1_id', 'commander2_id', 'id')
+        }
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.throttles = {}
+        self._given_up = set()
+        self._attempted_ids = set()
+        self.decks_fetched = 0
+        self.decks_unchanged = 0
+        self._stats_lock = threading.Lock()
+        self.elapsed_seconds = 0.0
+        # stage times are summed across each stage's workers. waiting on
+        # a host's rate limit counts as busy; the throttle reports that.
+        self.fetch_stage = _Stage('fetch')
+        self.db_stage = _Stage('database')
+
+    def run_queue(self, batch_size=CLAIM_BATCH_SIZE):
+        """Claim and fetch queued decks until there are none left for us.
+        Decks for hosts which are failing are left in the queue; see
+        `retry_after()`. Returns how many we claimed."""
+        claimed = 0
+        while batch := DeckCrawlResult.objects.claim(
+                self.worker, batch_size, LEASE_TIME, exclude_hosts=self._blocked_hosts()):
+            claimed += len(batch)
+            self.run(batch)
+        return claimed
+
+    def retry_after(self):
+        """Seconds until a host which is cooling off can be tried again,
+        or 0 if none are. Its decks are still waiting in the queue."""
+        cooling_off = [
+            throttle.breaker.open_for() for throttle in self.throttles.values()
+            if throttle.breaker.trips < MAX_BREAKER_TRIPS
+        ]
+        return min((seconds for seconds in cooling_off if seconds > 0), default=0.0)
+
+    def _blocked_hosts(self):
+        blocked = []
+        for host, throttle in self.throttles.items():
+            if throttle.breaker.trips >= MAX_BREAKER_TRIPS:
+                if host not in self._given_up:
+                    self._given_up.add(host)
+                    self._err(f"{host} keeps failing; leaving its decks for the next run")
+                blocked.append(host)
+            elif throttle.breaker.open_for() > 0:
+                blocked.append(host)
+        return blocked
+
+    def run(self, crawl_results):
+        by_host = {}
+        for crawl_result in crawl_results:
+            host = urlparse(crawl_result.url).hostname
+            by_host.setdefault(host, []).append(crawl_result)
+
+        self._attempted_ids = set()
+        start = time.perf_counter()
+        asyncio.run(self._fetch_all(by_host))
+        self.elapsed_seconds += time.perf_counter() - start
+
+        # anything we didn't get to because its host's circuit breaker
+        # opened goes back in the queue, rather than sitting out its lease
+        unfetched = [c.id for c in crawl_results if c.id not in self._attempted_ids]
+        if unfetched:
+            released = (
+                DeckCrawlResult.objects
+                .filter(id__in=unfetched, lease_owner=self.worker)
+                .update(lease_expires=None)
+            )
+            self._log(f"Released {released} decks to try again once their host recovers")
+
+    def report(self):
+        rate = self.decks_fetched / self.elapsed_seconds if self.elapsed_seconds else 0.0
+        return [
+            f"Fetched {self.decks_fetched} decks in {self.elapsed_seconds:.1f}s ({rate:.2f} decks/sec)",
+            f"{self.decks_unchanged} decks had the same cards as last time",
+            self.fetch_stage.report(),
+            self.db_stage.report(),
+            self._resolver.report(),
+        ] + [throttle.report() for throttle in self.throttles.values()]
+
+    async def _fetch_all(self, by_host):
+        # enough to keep the database workers fed, but no more
+        db_queue = asyncio.Queue(maxsize=self.db_workers * 2)
+        async with httpx.AsyncClient(headers=HEADERS) as client:
+            async with asyncio.TaskGroup() as tg:
+                db_tasks = [
+                    tg.create_task(self._apply_from(db_queue))
+                    for _ in range(self.db_workers)
+                ]
+
+                async with asyncio.TaskGroup() as fetchers:
+                    for host, crawl_results in by_host.items():
+                        throttle = self.throttles[host] = throttle_for_host(host)
+                        pending = iter(crawl_results)
+                        limits = HOST_LIMITS.get(host, DEFAULT_HOST_LIMITS)
+                        for _ in range(limits['concurrency']):
+                            fetchers.create_task(self._fetch_from(client, throttle, pending, db_queue))
+
+                for _ in db_tasks:
+                    await db_queue.put(None)
+
+    async def _fetch_from(self, client, throttle, pending, db_queue):
+        # workers for a host share the iterator, so each
+        # deck is taken by exactly one of them
+        for crawl_result in pending:
+            headers = None
+            if 'moxfield.com' in crawl_result.url:
+                if not MOXFIELD_HEADERS:
+                    self._attempted_ids.add(crawl_result.id)
+                    await self._to_db(db_queue, self._log, f"Skipping {crawl_result.url} due to missing Moxfield API key")
+                    continue
+                headers = MOXFIELD_HEADERS
+
+            start = time.perf_counter()
+            try:
+                response, retries = await throttle.request_async(
+                    lambda: client.get(crawl_result.url, headers=headers)
+                )
+            except CircuitOpen:
+                # the host is down; don't keep knocking. this deck and
+                # the rest of the host's get released after the batch
+                self.fetch_stage.busy_seconds += time.perf_counter() - start
+                return
+            except RequestFailed as e:
+                self._attempted_ids.add(crawl_result.id)
+                self.fetch_stage.busy_seconds += time.perf_counter() - start
+                await self._to_db(db_queue, self._handle_failure, crawl_result, e)
+                continue
+
+            self._attempted_ids.add(crawl_result.id)
+
+            try:
+                envelope = response.json() if 200 <= response.status_code < 300 else None
+            except ValueError as e:
+                self.fetch_stage.busy_seconds += time.perf_counter() - start
+                await self._to_db(db_queue, self._give_up, crawl_result, f"response isn't JSON ({e})")
+                continue
+            self.fetch_stage.items += 1
+            self.fetch_stage.busy_seconds += time.perf_counter() - start
+            await self._to_db(db_queue, self._handle_response, crawl_result, response, envelope, retries)
+
+    async def _to_db(self, db_queue, func, *args):
+        start = time.perf_counter()
+        await db_queue.put((func, args))
+        # a full queue means the database is the bottleneck
+        self.fetch_stage.idle_seconds += time.perf_counter() - start
+
+    async def _apply_from(self, db_queue):
+        loop = asyncio.get_running_loop()
+        # one thread per worker, so each keeps its own database connection
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='decklist-db') as executor:
+            try:
+                while True:
+                    start = time.perf_counter()
+                    work = await db_queue.get()
+                    self.db_stage.idle_seconds += time.perf_counter() - start
+                    if work is None:
+                        break
+
+                    func, args = work
+                    start = time.perf_counter()
+                    try:
+                        await loop.run_in_executor(executor, func, *args)
+                    except Exception as e:
+                        # one bad deck shouldn't take the rest of the batch
+                        # down with it, or leave it leased
+                        await self._recover(loop, executor, func, args, e)
+                    self.db_stage.items += 1
+                    self.db_stage.busy_seconds += time.perf_counter() - start
+            finally:
+                await loop.run_in_executor(executor, connections.close_all)
+
+    async def _recover(self, loop, executor, func, args, error):
+        # logging may write to the database, so it happens on the
+        # executor too, never on the event loop
+        try:
+            await loop.run_in_executor(executor, self._err, f"Error in {func.__name__}: {error!r}")
+            if args and isinstance(args[0], DeckCrawlResult):
+                await loop.run_in_executor(executor, self._give_up, args[0], repr(error))
+        except Exception as e:
+            # nowhere left to log it; the deck's lease will run out
+            print(f"Couldn't recover from {error!r}: {e!r}", file=sys.stderr)
+
+    def _handle_failure(self, crawl_result, error):
+        # leave it queued, and leased so we don't pick it right back up
+        self._err(f"Couldn't fetch {crawl_result.url}: {error}")
+        crawl_result.retries += error.retries
+        self._save_result(crawl_result, ['retries'])
+
+    def _save_result(self, crawl_result, fields):
+        # unless a newer crawl requeued the deck while we were fetching
+        # it; that one starts over, and shouldn't inherit our outcome
+        (
+            DeckCrawlResult.objects
+            .filter(pk=crawl_result.pk, updated_time=crawl_result.updated_time)
+            .update(**{field: getattr(crawl_result, field) for field in fields})
+        )
+
+    def _give_up(self, crawl_result, reason):
+        # mark deck as unfetchable and carry on
+        self._err(f"Giving up on \"{crawl_result.deck.name}\" ({crawl_result.url}): {reason}")
+        crawl_result.fetchable = False
+        self._save_result(crawl_result, ['fetchable', 'retries'])
+
+    def _handle_response(self, crawl_result, response, envelope, retries):
+        crawl_result.retries += retries
+        if 200 <= response.status_code < 300:
+            deck_name = crawl_result.deck.name
+            new_deck = crawl_result.deck.card_count == 0
+            verb = "Creating" if new_deck else "Updating"
+            try:
+                if crawl_result.deck.source == DataSource.ARCHIDEKT:
+                    self._log(f"{verb} \"{deck_name}\" (Archidekt)")
+                    self._process_archidekt_deck(crawl_result, envelope)
+                elif crawl_result.deck.source == DataSource.MOXFIELD:
+                    self._log(f"{verb} \"{deck_name}\" (Moxfield)")
+                    self._process_moxfield_deck(crawl_result, envelope)
+                else:
+                    self._err(f"Can't update \"{deck_name}\", unimplemented source")
+                    crawl_result.fetchable = False
+                    self._save_result(crawl_result, ['fetchable', 'retries'])
+            except (AttributeError, KeyError, TypeError) as e:
+                # not the shape of deck we know how to read
+                self._give_up(crawl_result, f"unexpected response ({e!r})")
+        elif is_transient(response):
+            # still failing after retries; leave it queued, and leased
+            # so we don't pick it right back up
+            self._err(f"Got {response.status_code} from server after {retries} retries. ({response.url})")
+            self._save_result(crawl_result, ['retries'])
+        elif response.status_code in (400, 404):
+            # mark deck as unfetchable and carry on
+            self._log(f"Got error {response.status_code} for \"{crawl_result.deck.name}\" ({crawl_result.url}).")
+            crawl_result.fetchable = False
+            self._save_result(crawl_result, ['fetchable', 'retries'])
+        else:
+            self._err(f"Got {response.status_code} from server. ({response.url})")
+            crawl_result.fetchable = False
+            self._save_result(crawl_result, ['fetchable', 'retries'])
+
+        if crawl_result.got_cards:
+            with self._stats_lock:
+                self.decks_fetched += 1
+            # done with it, unless a newer crawl requeued the
+            # deck while we were fetching it
+            (
+                DeckCrawlResult.objects
+                .filter(pk=crawl_result.pk, updated_time=crawl_result.updated_time)
+                .delete()
+            )
+
+    def _process_archidekt_deck(self, crawl_result, envelope):
+        cards = envelope['cards']
+
+        # determine categories to skip, categories which are commander
+        skip_categories = frozenset([
+            cat['name'] for cat in envelope['categories']
+            if not cat['includedInDeck']
+        ])
+        premier_categories = frozenset([
+            cat['name'] for cat in envelope['categories']
+            if cat['isPremier']
+        ])
+
+        # card ID -> whether it's a commander
+        # (several printings of the same card collapse into one entry)
+        deck_cards = {}
+
+        for card_json in cards:
+            card_categories = set(card_json['categories'] or [])
+            # if card is in a non-included category, skip it
+            if not card_categories.isdisjoint(skip_categories):
+                continue
+
+            # if card is in a premier category, it is a commander
+            is_commander = not card_categories.isdisjoint(premier_categories)
+
+            # resolve printings to cards
+            printing_id = card_json['card']['uid']
+            card_id = self._resolver.card_for_printing(printing_id)
+            if card_id is None:
+                name = card_json['card']['oracleCard']['name']
+                edition = card_json['card']['edition']['editioncode']
+                try:
+                    card_id = self._resolver.lookup_card(name, edition)
+                    self._log(f'Had to look up "{name}" ({edition})')
+                except CardNotFound:
+                    self._err(f'Could not resolve printing {printing_id}; should be "{name}" ({edition})')
+                    continue
+
+            deck_cards[card_id] = is_commander
+
+        self._save_deck(crawl_result, deck_cards)
+
+    def _process_moxfield_deck(self, crawl_result, envelope):
+        cards = envelope['mainboard']
+        cmdrs = envelope['commanders']
+
+        # card ID -> whether it's a commander
+        deck_cards = {}
+
+        for card_set, is_commander in ((cards, False), (cmdrs, True)):
+            for _, card_json in card_set.items():
+                # resolve printings to cards
+                printing_id = card_json['card']['scryfall_id']
+                card_id = self._resolver.card_for_printing(printing_id)
+                if card_id is None:
+                    name = card_json['card']['name']
+                    edition = card_json['card']['set']
+                    try:
+                        card_id = self._resolver.lookup_card(name, edition)
+                        self._log(f'Had to look up "{name}" ({edition})')
+                    except CardNotFound:
+                        self._err(f'Could not resolve printing {printing_id}; should be "{name}" ({edition})')
+                        continue
+
+                deck_cards[card_id] = is_commander
+
+        self._save_deck(crawl_result, deck_cards)
+
+    def _commander_for(self, card_ids):
+        card_ids = sorted(card_ids)
+        key = tuple((card_ids + [None])[:2])
+        if key not in self._commanders:
+            self._commanders[key] = Commander.objects.for_cards(card_ids).id
+        return self._commanders[key]
+
+    def _save_deck(self, crawl_result, deck_cards):
+        deck = crawl_result.deck
+        fingerprint = card_fingerprint(deck_cards.items())
+        if fingerprint == deck.card_fingerprint:
+            # only the deck's name or description changed, or nothing
+            # at all; its cards and legality are already right
+            with self._stats_lock:
+                self.decks_unchanged += 1
+            crawl_result.got_cards = True
+            return
+
+        # reuse cards where we can
+        current_cards = {
+            c.card_id: c for c in CardInDeck.objects.filter(deck=deck)
+        }
+        update_cards = []
+        new_cards = []
+        for card_id, is_commander in deck_cards.items():
+            if card_id in current_cards:
+                reuse_card = current_cards.pop(card_id)
+                if reuse_card.is_pdh_commander != is_commander:
+                    reuse_card.is_pdh_commander = is_commander
+                    update_cards.append(reuse_card)
+            else:
+                new_cards.append(CardInDeck(
+                    deck=deck,
+                    card_id=card_id,
+                    is_pdh_commander=is_commander,
+                ))
+
+        with transaction.atomic():
+            (
+                CardInDeck.objects
+                .filter(deck=deck)
+                .filter(card_id__in=current_cards.keys())
+                .delete()
+            )
+            CardInDeck.objects.bulk_create(new_cards)
+            CardInDeck.objects.bulk_update(update_cards, ['is_pdh_commander'])
+
+        # now see if the deck is legal before completing processing,
+        # and summarize it while we have the card list at hand
+        deck.pdh_legal, _ = self._legality.check(deck_cards.items())
+        deck.identity = self._legality.identity(deck_cards.items())
+        deck.card_count = len(deck_cards)
+        if deck.pdh_legal:
+            deck.commander_id = self._commander_for(
+                card_id for card_id, is_commander in deck_cards.items() if is_commander
+            )
+        else:
+            # don't keep counting it toward its old commander
+            deck.commander_id = None
+        deck.card_fingerprint = fingerprint
+        deck.cards_updated_time = timezone.now()
+
+        # the crawler may have updated the deck's other fields since we
+        # claimed it, so leave those alone
+        deck.save(update_fields=[
+            'pdh_legal', 'identity', 'card_count', 'commander',
+            'card_fingerprint', 'cards_updated_time',
+        ])
+        crawl_result.got_cards = True
@@ -0,0 +1,72 @@
+import time
+
+from decklist.legality import CHUNK_SIZE, LegalityChecker, read_deck_chunks, save_changes
+from crawler.legality_worker import load_checker, check_chunk
+from crawler.worker_pool import DEFAULT_WORKERS, run_chunks
+
+
+class LegalityRecheck:
+    """Rechecks the legality of a set of decks in bulk.
+
+    Decks are read in chunks along with their card lists, checked by a
+    pool of worker processes, and any changes are written back with
+    one `bulk_update` per chunk. Only a few chunks are in flight at a
+    time, so memory stays flat however many decks there are.
+
+    With `workers=0`, decks are checked inline on the calling thread."""
+
+    def __init__(self, log, workers=DEFAULT_WORKERS, chunk_size=CHUNK_SIZE):
+        self._log = log
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.decks_checked = 0
+        self.decks_changed = 0
+        self.check_seconds = 0.0
+        self.elapsed_seconds = 0.0
+        self._started = None
+
+    def run(self, decks):
+        "Recheck every deck in the `decks` queryset"
+        start = self._started = time.perf_counter()
+        try:
+            if self.workers == 0:
+                self._run_inline(decks)
+            else:
+                self._run_parallel(decks)
+        finally:
+            self.elapsed_seconds += time.perf_counter() - start
+
+    def report(self):
+        return [
+            f"Checked {self.decks_checked} decks in {self.elapsed_seconds:.1f}s "
+            f"({self._rate():.0f} decks/sec); {self.decks_changed} changed",
+            f"checking: {self.check_seconds:.1f}s busy (summed across workers)",
+        ]
+
+    def _rate(self):
+        return self.decks_checked / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def _run_inline(self, decks):
+        checker = LegalityChecker()
+        for chunk in read_deck_chunks(decks, self.chunk_size):
+            self._apply(check_chunk(chunk, checker))
+
+    def _run_parallel(self, decks):
+        for checked in run_chunks(check_chunk, read_deck_chunks(decks, self.chunk_size), self.workers, setup=load_checker):
+            self._apply(checked)
+
+    def _apply(self, checked):
+        size, changes, seconds = checked
+        for deck_id, name, is_legal, reason in changes:
+            self._log(f"{name} ({deck_id}) {is_legal=} {reason=}")
+        save_changes(changes)
+
+        self.decks_checked += size
+        self.decks_changed += len(changes)
+        self.check_seconds += seconds
+        seconds = time.perf_counter() - self._started
+        rate = self.decks_checked / seconds if seconds else 0.0
+        self._log(
+            f"... {self.decks_checked} decks checked, {self.decks_changed} changed "
+            f"({rate:.0f} decks/sec)"
+        )
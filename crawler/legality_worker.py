@@ -0,0 +1,17 @@
+"""
+Work done in recheck-deck-legality's worker processes; see
+crawler.worker_pool.
+"""
+_checker = None
+
+
+def load_checker():
+    global _checker
+    from decklist.legality import LegalityChecker
+    _checker = LegalityChecker()
+
+
+def check_chunk(decks, checker=None):
+    "`decklist.legality.check_chunk()` against this process's checker"
+    from decklist import legality
+    return legality.check_chunk(decks, checker or _checker)
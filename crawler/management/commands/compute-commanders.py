@@ -1,5 +1,9 @@
+from django.contrib.postgres.aggregates import ArrayAgg
 from ._command_base import LoggingBaseCommand
-from decklist.models import Deck, Commander
+from decklist.models import Deck, CardInDeck, Commander
+
+
+CHUNK_SIZE = 2000
 
 
 class Command(LoggingBaseCommand):
@@ -12,40 +16,66 @@ class Command(LoggingBaseCommand):
     def handle(self, *args, **options):
         super().handle(*args, **options)
 
-        query = Deck.objects.filter(pdh_legal=True)
+        decks = Deck.objects.filter(pdh_legal=True)
         if options['all']:
             self._log('Re-computing all commanders for PDH-legal decks')
         else:
             self._log('Computing new commanders for PDH-legal decks')
-            query = query.filter(commander__isnull=True)
-
-        for deck in query:
-            match list(deck.commander_cards()):
-                case [commander1]:
-                    cmdr, created = Commander.objects.get_or_create(
-                        commander1=commander1.card,
-                        commander2=None,
-                    )
-                case [commander1, commander2]:
-                    # commander1 should have an ID <= commander2's
-                    if commander1.card.id > commander2.card.id:
-                        commander1, commander2 = commander2, commander1
-                    cmdr, created = Commander.objects.get_or_create(
-                        commander1=commander1.card,
-                        commander2=commander2.card,
-                    )
-                case _:
-                    self._err(f"{deck} ({deck.id}) has illegal number of commanders")
-                    continue
-
-            # reminder: if a value was bound in a previous iteration, it will
-            # remain bound here even if not set in the most recent iteration.
-            # make sure to `continue` out of any match branch that shouldn't
-            # save the deck, and make sure `cmdr`/`deck`/`created` are properly
-            # set before getting here.
-            if created:
-                self._log(f"created commander {cmdr}")
-            deck.commander = cmdr
-            deck.save()
-        
+            decks = decks.filter(commander__isnull=True)
+
+        # a legal deck should always have commander cards, but just in case
+        for deck in decks.exclude(card_list__is_pdh_commander=True):
+            self._err(f"{deck} ({deck.id}) has illegal number of commanders")
+
+        # (commander1 ID, commander2 ID) -> Commander ID
+        self._commanders = {
+            (card1, card2): cmdr_id
+            for card1, card2, cmdr_id in Commander.objects.values_list('commander1_id', 'commander2_id', 'id')
+        }
+        self._created = 0
+        self._updated = 0
+
+        # every deck's commander cards, in one pass
+        rows = (
+            CardInDeck.objects
+            .filter(is_pdh_commander=True, deck__in=decks)
+            .values('deck_id', 'deck__name', 'deck__commander_id')
+            .annotate(cards=ArrayAgg('card_id', ordering='card_id'))
+            .values_list('deck_id', 'deck__name', 'deck__commander_id', 'cards')
+            .order_by('deck_id')
+        )
+        chunk = []
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                self._assign(chunk)
+                chunk = []
+        if chunk:
+            self._assign(chunk)
+
+        self._log(f"Created {self._created} commanders and updated {self._updated} decks")
         self._log("Done!")
+
+    def _assign(self, chunk):
+        pairs = {}
+        for deck_id, deck_name, current_commander_id, cards in chunk:
+            if len(cards) > 2:
+                self._err(f"{deck_name} ({deck_id}) has illegal number of commanders")
+                continue
+            # commander1 should have an ID <= commander2's, which
+            # the aggregate's ordering takes care of
+            pairs[deck_id] = (current_commander_id, tuple((cards + [None])[:2]))
+
+        missing = {pair for _, pair in pairs.values()} - self._commanders.keys()
+        if missing:
+            commander_ids, created = Commander.objects.create_for_pairs(missing)
+            self._commanders.update(commander_ids)
+            self._created += created
+
+        changed = [
+            Deck(id=deck_id, commander_id=self._commanders[pair])
+            for deck_id, (current_commander_id, pair) in pairs.items()
+            if current_commander_id != self._commanders[pair]
+        ]
+        Deck.objects.bulk_update(changed, ['commander'])
+        self._updated += len(changed)
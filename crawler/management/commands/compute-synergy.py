@@ -1,6 +1,6 @@
 from ._command_base import LoggingBaseCommand
 from django.core.management.base import CommandError
-from decklist.models import Card, Rarity, SynergyScore
+from decklist.models import Card, SynergyScore
 from decklist.synergy import compute_synergy_bulk
 import math
 
@@ -44,7 +44,7 @@ class Command(LoggingBaseCommand):
                 Card.objects
                 .filter(
                     # skip cards never printed at common
-                    printings__rarity=Rarity.COMMON,
+                    has_common_printing=True,
                     deck_list__deck__pdh_legal=True,
                 )
                 .distinct()
@@ -1,78 +1,67 @@
+from django.db import transaction
 from ._command_base import LoggingBaseCommand
-from django.db.models import Count, Q, F, Value
 from django.core.management.base import CommandError
-from decklist.models import Deck, Commander, Theme, ThemeResult
+from decklist.models import Commander, Theme, ThemeResult
+from decklist.themes import ThemeEngine
+
+
+CHUNK_SIZE = 5000
 
 
 class Command(LoggingBaseCommand):
-    help = 'Compute themes for commanders'
+    help = 'Compute themes for commanders whose decks changed since the last run'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every commander, even if nothing changed (e.g. after new card data)',
+        )
 
     def handle(self, *args, **options):
         super().handle(*args, **options)
 
         self._log("Computing themes")
 
-        for theme in Theme.objects.all():
+        themes = list(Theme.objects.all())
+        for theme in themes:
             self._log(f"{theme}")
-            theme_decks = self._get_decks_for_theme(theme)
-
-            theme_cmdrs = (
-                Commander.objects
-                .annotate(
-                    theme_decks=Count(
-                        'decks',
-                        filter=Q(decks__in=theme_decks),
-                        unique=True,
-                    ),
-                    total_decks=Count('decks', unique=True),
-                )
-                .filter(theme_decks__gt=1)
-                .filter(theme_decks__gte=F('total_decks') * Value(theme.deck_threshold / 100.0))
-            )
 
-            # add or update commanders
-            for cmdr in theme_cmdrs:
-                ThemeResult.objects.update_or_create(
-                    theme=theme, commander=cmdr,
-                    defaults={
-                        'theme_deck_count': cmdr.theme_decks,
-                        'total_deck_count': cmdr.total_decks,
-                    }
-                )
-            
-            # delete irrelevant commanders
-            (
-                ThemeResult.objects
-                .filter(theme=theme)
-                .exclude(commander__in=[cmdr for cmdr in theme_cmdrs])
-                .delete()
-            )
-
-        self._log("Done!")
+        try:
+            engine = ThemeEngine(themes)
+        except ValueError as e:
+            raise CommandError(str(e))
 
-    def _get_decks_for_theme(self, theme):
-        match theme.filter_type:
-            case Theme.Type.TYPAL:
-                return (
-                        Deck.objects
-                        .filter(pdh_legal=True)
-                        .annotate(theme_count=Count(
-                            'card_list',
-                            filter=Q(card_list__card__type_line__contains=theme.filter_text),
-                        ))
-                        .filter(theme_count__gt=theme.card_threshold)
-                    )
+        # a commander needs recomputing if its decks (or the themes)
+        # changed since its results were stored
+        fingerprints = engine.fingerprints()
+        stored = dict(Commander.objects.values_list('id', 'themes_fingerprint'))
+        if options['full']:
+            stale = list(stored)
+        else:
+            stale = [
+                cmdr_id for cmdr_id, fingerprint in stored.items()
+                if fingerprints.get(cmdr_id, '') != fingerprint
+            ]
+        self._log(f"Recomputing {len(stale)} of {len(stored)} commanders")
 
-            case Theme.Type.KEYWORD:
-                return (
-                    Deck.objects
-                    .filter(pdh_legal=True)
-                    .annotate(keyword_count=Count(
-                        'card_list',
-                        filter=Q(card_list__card__keywords__contains=theme.filter_text),
-                    ))
-                    .filter(keyword_count__gt=theme.card_threshold)
+        created = updated = deleted = 0
+        for start in range(0, len(stale), CHUNK_SIZE):
+            chunk = stale[start:start + CHUNK_SIZE]
+            commanders = Commander.objects.filter(id__in=chunk)
+            results = engine.compute(commanders)
+            with transaction.atomic():
+                c, u, d = ThemeResult.objects.filter(commander__in=commanders).sync(results)
+                Commander.objects.bulk_update(
+                    [Commander(id=cmdr_id, themes_fingerprint=fingerprints.get(cmdr_id, '')) for cmdr_id in chunk],
+                    ['themes_fingerprint'],
+                    batch_size=1000,
                 )
+            created += c
+            updated += u
+            deleted += d
 
-            case _:
-                raise CommandError(f"Not prepared to handle a theme of type {theme.filter_type}")
+        self._log(f"Theme results: {created} new, {updated} updated, {deleted} removed")
+
+        self._log("Done!")
@@ -0,0 +1,112 @@
+"""
+Runs every source's search crawl and the decklist fetch queue at the
+same time. Each talks to its own host and spends most of its time
+waiting on the network or its rate limit, so there's no reason to let
+one finish before starting the next.
+"""
+import threading
+import time
+from django.core.management.base import CommandError
+from django.db import connection
+from crawler.crawl_runner import CrawlRunner
+from crawler.crawlers import ArchidektCrawler, MoxfieldCrawler, HEADERS, MOXFIELD_HEADERS
+from crawler.decklist_fetcher import DecklistFetcher
+from ._command_base import LoggingBaseCommand
+
+
+# how long the decklist fetcher waits for the crawlers to queue more decks
+POLL_SECONDS = 10
+
+
+class Command(LoggingBaseCommand):
+    help = 'Crawl all sources for PDH decklists and fetch them, concurrently'
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+        start = time.perf_counter()
+
+        self._log("Starting crawls and decklist fetching")
+        self._failures = []
+        self._timings = {}
+
+        crawls = [('Archidekt', ArchidektCrawler, HEADERS)]
+        if MOXFIELD_HEADERS:
+            crawls.append(('Moxfield', MoxfieldCrawler, MOXFIELD_HEADERS))
+        else:
+            self._log("Skipping Moxfield crawl due to missing Moxfield API key")
+
+        crawl_threads = [
+            threading.Thread(
+                target=self._run_in_thread,
+                args=(name, self._crawl, crawler_class, headers),
+                name=f'crawl-{name}',
+            )
+            for name, crawler_class, headers in crawls
+        ]
+        crawls_done = threading.Event()
+        fetch_thread = threading.Thread(
+            target=self._run_in_thread,
+            args=('decklists', self._fetch_decklists, crawls_done),
+            name='fetch-decklists',
+        )
+
+        for thread in crawl_threads:
+            thread.start()
+        fetch_thread.start()
+        for thread in crawl_threads:
+            thread.join()
+        crawls_done.set()
+        fetch_thread.join()
+
+        for name, seconds in self._timings.items():
+            self._log(f"{name} took {seconds:.1f}s")
+        self._log(f"Done in {time.perf_counter() - start:.1f}s")
+
+        if self._failures:
+            raise CommandError("; ".join(self._failures))
+
+    def _run_in_thread(self, name, target, *args):
+        start = time.perf_counter()
+        log = lambda text: self._log(f"[{name}] {text}")
+        err = lambda text: self._err(f"[{name}] {text}")
+        try:
+            target(log, err, *args)
+        except Exception as e:
+            # keep the other sources going
+            err(f"failed: {e!r}")
+            self._failures.append(f"{name} failed")
+        finally:
+            self._timings[name] = time.perf_counter() - start
+            # each thread had its own database connection
+            connection.close()
+
+    def _crawl(self, log, err, crawler_class, headers):
+        # request-by-request chatter doesn't go in the database log
+        def echo(text):
+            if not self._no_stdout:
+                self.stdout.write(text)
+        def echo_err(text):
+            if not self._no_stdout:
+                self.stderr.write(self.style.ERROR(text))
+
+        runner = CrawlRunner(crawler_class, headers, log, err, echo=echo, echo_err=echo_err)
+        runner.run()
+
+    def _fetch_decklists(self, log, err, crawls_done):
+        fetcher = DecklistFetcher(log, err)
+        while True:
+            # check first, so we can't miss decks queued by the last page
+            crawls_finished = crawls_done.is_set()
+            if fetcher.run_queue():
+                continue
+            if wait := fetcher.retry_after():
+                # some host is failing; its decks wait out the cooldown
+                log(f"Waiting {wait:.0f}s for failing hosts to recover")
+                time.sleep(wait)
+            elif crawls_finished:
+                break
+            else:
+                crawls_done.wait(POLL_SECONDS)
+
+        for line in fetcher.report():
+            log(line)
@@ -2,19 +2,11 @@
 See https://www.moxfield.com/help/faq#moxfield-api for more on crawling Moxfield.
 Also note that since November 2024, Moxfield requires an API key.
 """
-from django.conf import settings
-
 from ._crawl_base import CrawlCommand
-from decklist.models import DataSource
-from crawler.crawlers import MoxfieldCrawler, MOXFIELD_API_BASE, HEADERS
+from crawler.crawlers import MoxfieldCrawler, MOXFIELD_HEADERS
 
 
-if settings.MOXFIELD_API_KEY:
-    _HEADERS = HEADERS.copy()
-    _HEADERS.update({
-        'User-agent': settings.MOXFIELD_API_KEY,
-    })
-else:
+if not MOXFIELD_HEADERS:
     # TODO: could warn instead of raise
     raise ValueError("Could not get settings.MOXFIELD_API_KEY; is SMALLFORMATS_MOXFIELD_USERAGENT set in the environment?")
 
@@ -22,6 +14,4 @@ class Command(CrawlCommand):
     help = f'Ask Moxfield for PDH decklists'
 
     Crawler = MoxfieldCrawler
-    DATASOURCE = DataSource.MOXFIELD
-    API_BASE = MOXFIELD_API_BASE
-    HEADERS = _HEADERS
+    HEADERS = MOXFIELD_HEADERS
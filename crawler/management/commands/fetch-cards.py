@@ -1,76 +1,217 @@
 """
 See https://scryfall.com/docs/api/bulk-data for more on Scryfall data.
 """
-from django.db.utils import DataError
-from django.utils.dateparse import parse_date
+import codecs
+import gzip
+import mmap
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.utils.dateparse import parse_datetime
 import httpx
-import json_stream.httpx
+import json_stream
 # don't use Rust-based tokenizer
 # it throws an OSError about incomplete utf-8 sequences
 from json_stream.tokenizer import tokenize
-from decklist.models import Card, Printing, PartnerType, Rarity
+from decklist.legality import recheck_decks_containing
+from decklist.models import BannedCard, Card, Commander, Printing
+from crawler.models import BulkDataFetch
 from crawler.crawlers import HEADERS, SCRYFALL_API_BASE
-from crawler.card_parsing import parse_card_and_printing, FailedToParseCard
+from crawler.card_ingest import CardBatchWriter, IngestPipeline, DEFAULT_BATCH_SIZE
+from crawler.worker_pool import DEFAULT_WORKERS
 from ._command_base import LoggingBaseCommand
 
 
 PROGRESS_EVERY_N_CARDS = 100
+BULK_TYPE = 'default_cards'
+# how many downloaded bulk files to keep around in the cache
+KEEP_CACHED_FILES = 3
+GZIP_MAGIC = b'\x1f\x8b'
 
 class Command(LoggingBaseCommand):
     help = 'Ask Scryfall for card data'
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help='Number of parse processes (0 parses inline)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Ingest the bulk file even if we already have this version',
+        )
+        parser.add_argument(
+            '--from-file',
+            type=Path,
+            metavar='PATH',
+            help='Ingest a local bulk file (plain or gzipped JSON) instead of downloading',
+        )
+
     def handle(self, *args, **options):
         super().handle(*args, **options)
 
+        writer = CardBatchWriter(self._log, self._err, options['batch_size'])
+        pipeline = IngestPipeline(writer, self._err, options['workers'])
+        start = time.perf_counter()
+
         self._log(f"Fetch cards begin: {Card.objects.all().count()} cards, {Printing.objects.all().count()} printings")
-        with httpx.Client(base_url=SCRYFALL_API_BASE, headers=HEADERS) as client:
-            result = client.get("bulk-data/default-cards", timeout=httpx.Timeout(10.0))
-            if result.is_error:
-                self._err(f"{result.status_code}: {result.reason_phrase}")
-            result.raise_for_status()
-            download_target = result.json()["download_uri"]
-            self._log(f"Fetching {download_target}")
-
-            card_count = PROGRESS_EVERY_N_CARDS
-            with client.stream('GET', download_target) as f:
-                for json_card in json_stream.httpx.load(f, tokenizer=tokenize).persistent():
-                    card_count -= 1
-                    if card_count <= 0:
-                        self.stdout.write('.', ending='')
-                        self.stdout.flush()
-                        card_count = PROGRESS_EVERY_N_CARDS
-                    
-                    if not self._want_card(json_card):
-                        continue
-
-                    try:
-                        c, p = parse_card_and_printing(json_card)
-
-                    except FailedToParseCard as e:                    
-                        self._err(f"failed to parse {json_card['name']}")
-                        for k, v in e.args[0].items():
-                            self._err(f".. {k}: {v}")
-                        continue
-
-                    try:
-                        if len(c.name) > 100:
-                            # Market Research Elemental 🙄
-                            c.name = c.name[:47] + '...'
-                        c.save()
-                        p.save()
-                    except DataError as e:
-                        self._log(f"Card {c.name} or printing {p} threw {e}")
 
+        if options['from_file']:
+            bulk_data = None
+            bulk_file = options['from_file']
+            if not bulk_file.is_file():
+                self._err(f"{bulk_file} is not a file")
+                raise CommandError(f"{bulk_file} is not a file")
+        else:
+            with httpx.Client(base_url=SCRYFALL_API_BASE, headers=HEADERS) as client:
+                result = client.get("bulk-data/default-cards", timeout=httpx.Timeout(10.0))
+                if result.is_error:
+                    self._err(f"{result.status_code}: {result.reason_phrase}")
+                result.raise_for_status()
+                bulk_data = result.json()
+
+                if not options['force'] and self._already_ingested(bulk_data):
+                    self._log(f"Scryfall's {BULK_TYPE} file hasn't changed since {bulk_data['updated_at']}; skipping (use --force to override)")
+                    return
+
+                bulk_file = self._download(client, bulk_data["download_uri"])
+
+        self._log(f"Ingesting {bulk_file} with {options['workers']} parse workers")
+        self._ingest(bulk_file, pipeline)
+
+        flags_changed = Card.objects.refresh_rarity_flags()
+        self._log(f"Refreshed rarity flags on {flags_changed} cards")
+        defaults_changed = Card.objects.refresh_default_printings()
+        self._log(f"Refreshed default printings on {defaults_changed} cards")
+        identities_changed = Commander.objects.refresh_identities()
+        self._log(f"Refreshed color identity on {identities_changed} commanders")
+        newly_banned = BannedCard.objects.seed_initial()
+        if newly_banned:
+            checked, changed = recheck_decks_containing(newly_banned)
+            self._log(f"Banned {len(newly_banned)} cards; {changed} of {checked} decks with them changed legality")
+
+        if bulk_data:
+            BulkDataFetch.objects.create(
+                bulk_type=BULK_TYPE,
+                updated_at=parse_datetime(bulk_data['updated_at']),
+                size=bulk_data['size'],
+                download_uri=bulk_data['download_uri'],
+            )
+
+        elapsed = time.perf_counter() - start
         self.stdout.write('')
+        self._log(writer.summary())
+        for stage_report in pipeline.report():
+            self._log(stage_report)
+        self._log(
+            f"Handled {writer.rows_seen} rows ({writer.rows_written} written) in {elapsed:.1f}s: "
+            f"{writer.rows_seen / elapsed:.0f} rows/sec overall, "
+            f"{writer.rows_per_second():.0f} rows/sec while writing"
+        )
         self._log(f"end: {Card.objects.all().count()} cards, {Printing.objects.all().count()} printings")
 
-    def _want_card(self, json_card):
-        # we want to exclude some non-playable cards but aren't entirely
-        # beholden to upstream's record of format legalities
-        if 'layout' in json_card and json_card['layout'] in (
-            'planar', 'scheme', 'vanguard', 'token', 'double_faced_token',
-            'emblem', 'art_series', 'reversible_card',
-        ):
+    def _download(self, client, download_target):
+        cache_dir = Path(settings.BULK_DATA_CACHE_DIR)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Scryfall puts a timestamp in the file name, so a file we've
+        # already downloaded is the same version
+        bulk_file = cache_dir / (Path(urlparse(download_target).path).name + '.gz')
+        if bulk_file.exists():
+            self._log(f"Using cached {bulk_file}")
+            return bulk_file
+
+        self._log(f"Fetching {download_target}")
+        partial_file = bulk_file.with_name(bulk_file.name + '.partial')
+        try:
+            with client.stream('GET', download_target) as response:
+                response.raise_for_status()
+                with gzip.open(partial_file, 'wb') as f:
+                    for chunk in response.iter_bytes():
+                        f.write(chunk)
+        except Exception:
+            partial_file.unlink(missing_ok=True)
+            raise
+        partial_file.rename(bulk_file)
+
+        # clean out older downloads
+        cached = sorted(
+            cache_dir.glob('*.json.gz'),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True,
+        )
+        for old_file in cached[KEEP_CACHED_FILES:]:
+            old_file.unlink()
+
+        return bulk_file
+
+    def _ingest(self, bulk_file, pipeline):
+        if bulk_file.stat().st_size == 0:
+            self._err(f"{bulk_file} is empty")
+            raise CommandError(f"{bulk_file} is empty")
+
+        with open(bulk_file, 'rb') as raw, mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:2] == GZIP_MAGIC:
+                f = gzip.GzipFile(fileobj=mapped)
+            else:
+                f = mapped
+
+            with f:
+                pipeline.run(self._read_cards(f))
+
+    def _read_cards(self, f):
+        # Scryfall writes one card per line, which lets the parse workers
+        # do the JSON decoding. Anything else goes through json_stream
+        # here on the reader.
+        if self._is_one_card_per_line(f):
+            entries = self._read_lines(f)
+        else:
+            self._log("Bulk file isn't one card per line; decoding it on the reader")
+            entries = self._read_json_stream(f)
+
+        card_count = PROGRESS_EVERY_N_CARDS
+        for entry in entries:
+            card_count -= 1
+            if card_count <= 0:
+                self.stdout.write('.', ending='')
+                self.stdout.flush()
+                card_count = PROGRESS_EVERY_N_CARDS
+
+            yield entry
+
+    def _is_one_card_per_line(self, f):
+        first, second = f.readline().strip(), f.readline().strip().rstrip(b',')
+        f.seek(0)
+        return first == b'[' and second.startswith(b'{') and second.endswith(b'}')
+
+    def _read_lines(self, f):
+        for line in iter(f.readline, b''):
+            line = line.strip().rstrip(b',')
+            if line in (b'', b'[', b']'):
+                continue
+            yield line
+
+    def _read_json_stream(self, f):
+        if isinstance(f, mmap.mmap):
+            # mmap isn't quite file-like enough for json_stream
+            f = codecs.getreader('utf-8')(f)
+        for json_card in json_stream.load(f, tokenizer=tokenize).persistent():
+            # parse workers need plain dicts they can pickle
+            yield json_stream.to_standard_types(json_card)
+
+    def _already_ingested(self, bulk_data):
+        try:
+            last = BulkDataFetch.objects.filter(bulk_type=BULK_TYPE).latest()
+        except BulkDataFetch.DoesNotExist:
             return False
 
-        return True
+        return (
+            last.updated_at == parse_datetime(bulk_data['updated_at'])
+            and last.size == bulk_data['size']
+        )
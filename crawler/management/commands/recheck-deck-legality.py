@@ -1,20 +1,67 @@
+from datetime import datetime
 from django.core.management.base import BaseCommand, CommandError
-from decklist.models import Deck
+from django.db.models import Q
+from django.utils import timezone
+from decklist.models import Card, Deck
+from crawler.legality_recheck import LegalityRecheck, CHUNK_SIZE
+from crawler.worker_pool import DEFAULT_WORKERS
+
+
+def _datetime(value):
+    when = datetime.fromisoformat(value)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
 
 
 class Command(BaseCommand):
     help = 'Revalidate legality of decks'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help='Number of checking processes (0 checks inline)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            '--since',
+            type=_datetime,
+            metavar='DATETIME',
+            help='Only recheck decks ingested or updated since this ISO date/time',
+        )
+        parser.add_argument(
+            '--card',
+            action='append',
+            metavar='NAME',
+            help='Only recheck decks containing this card (may be repeated)',
+        )
+
     def handle(self, *args, **options):
+        decks = Deck.objects.all()
+
+        if since := options['since']:
+            decks = decks.filter(
+                Q(ingested_time__gte=since)
+                | Q(updated_time__gte=since)
+                | Q(cards_updated_time__gte=since)
+            )
+
+        if names := options['card']:
+            cards = list(Card.objects.filter(name__in=names))
+            missing = set(names) - {card.name for card in cards}
+            if missing:
+                raise CommandError(f"no such card: {', '.join(sorted(missing))}")
+            decks = decks.containing(cards)
+
         pre_check = Deck.objects.filter(pdh_legal=True).count()
         self.stdout.write(f"Pre-check: {pre_check} legal decks")
 
-        for deck in Deck.objects.all():
-            is_legal, reason = deck.check_deck_legality()
-            if is_legal != deck.pdh_legal:
-                self.stdout.write(f"{deck} {is_legal=} {reason=}")
-                deck.pdh_legal = is_legal
-                deck.save()
+        recheck = LegalityRecheck(self.stdout.write, options['workers'], options['chunk_size'])
+        recheck.run(decks)
+        for line in recheck.report():
+            self.stdout.write(line)
 
         post_check = Deck.objects.filter(pdh_legal=True).count()
         self.stdout.write(f"Post-check: {post_check} legal decks")
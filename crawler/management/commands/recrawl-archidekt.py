@@ -1,5 +1,6 @@
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import BaseCommand
 from django.utils import timezone
+from crawler.crawlers import ArchidektCrawler
 from crawler.models import DeckCrawlResult
 from decklist.models import Deck, DataSource
 
@@ -9,11 +10,20 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         now = timezone.now()
-        for deck in Deck.objects.filter(source=DataSource.ARCHIDEKT):
-            url = f'https://archidekt.com/api/decks/{deck.source_id}/'
-            c = DeckCrawlResult(
-                deck=deck,
-                url=url,
-                updated_time=now,
-            )
-            c.save()
+        decks = (
+            Deck.objects
+            .filter(source=DataSource.ARCHIDEKT)
+            .only('id', 'source_id')
+        )
+        queued = DeckCrawlResult.objects.enqueue(
+            (
+                DeckCrawlResult(
+                    deck=deck,
+                    url=ArchidektCrawler.DECK_FETCH_LINK.format(deck.source_id),
+                    updated_time=now,
+                )
+                for deck in decks.iterator()
+            ),
+            batch_size=1000,
+        )
+        self.stdout.write(f"Queued {queued} Archidekt decks")
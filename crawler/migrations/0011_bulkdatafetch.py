@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0010_drop_follows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkDataFetch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bulk_type', models.CharField(max_length=30)),
+                ('updated_at', models.DateTimeField()),
+                ('size', models.BigIntegerField()),
+                ('download_uri', models.URLField(max_length=300)),
+                ('ingested_time', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'get_latest_by': 'ingested_time',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0011_bulkdatafetch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deckcrawlresult',
+            name='retries',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0012_deckcrawlresult_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deckcrawlresult',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deckcrawlresult',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
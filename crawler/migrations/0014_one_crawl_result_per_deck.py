@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:22
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def collapse_duplicates(apps, schema_editor):
+    # keep each deck's pending entry with the newest crawl, if it has
+    # one, and its newest entry otherwise
+    DeckCrawlResult = apps.get_model('crawler', 'DeckCrawlResult')
+    keep = (
+        DeckCrawlResult.objects
+        .filter(deck=OuterRef('deck'))
+        .order_by('got_cards', '-fetchable', '-updated_time', '-id')
+        .values('id')[:1]
+    )
+    DeckCrawlResult.objects.exclude(id=Subquery(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0013_deckcrawlresult_lease'),
+        ('decklist', '0028_card_default_printing'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='deckcrawlresult',
+            constraint=models.UniqueConstraint(fields=('deck',), name='one_crawl_result_per_deck'),
+        ),
+    ]
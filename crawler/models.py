@@ -1,4 +1,8 @@
-from django.db import models
+from itertools import islice
+
+from django.db import connections, models, transaction
+from django.db.models import Q
+from django.utils import timezone
 from decklist.models import Deck, DataSource
 
 
@@ -26,7 +30,84 @@ class CrawlRun(models.Model):
         return f"Run {self.id} [{self.get_target_display()}] ({self.crawl_start_time})"
 
 
+class DeckCrawlResultQuerySet(models.QuerySet):
+    def enqueue(self, crawl_results, batch_size=1000):
+        """Queue decks to be fetched. A deck which is already queued
+        keeps its one entry: a newer crawl replaces it, clearing any
+        lease and retries, and an older one is ignored. Returns how
+        many entries were added or replaced."""
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        crawl_results = iter(crawl_results)
+        queued = 0
+        with connection.cursor() as cursor:
+            while batch := list(islice(crawl_results, batch_size)):
+                # one statement can't touch the same deck twice
+                newest = {}
+                for crawl_result in batch:
+                    current = newest.get(crawl_result.deck_id)
+                    if current is None or crawl_result.updated_time > current.updated_time:
+                        newest[crawl_result.deck_id] = crawl_result
+
+                cursor.execute(
+                    f"""
+                    INSERT INTO {table}
+                        (url, deck_id, updated_time, fetchable, got_cards,
+                         retries, lease_owner, lease_expires)
+                    VALUES {', '.join(['(%s, %s, %s, %s, %s, 0, %s, NULL)'] * len(newest))}
+                    ON CONFLICT (deck_id) DO UPDATE SET
+                        url = EXCLUDED.url,
+                        updated_time = EXCLUDED.updated_time,
+                        fetchable = EXCLUDED.fetchable,
+                        got_cards = EXCLUDED.got_cards,
+                        retries = 0,
+                        lease_owner = '',
+                        lease_expires = NULL
+                    WHERE EXCLUDED.updated_time > {table}.updated_time
+                    """,
+                    [
+                        value
+                        for c in newest.values()
+                        for value in (c.url, c.deck_id, c.updated_time, c.fetchable, c.got_cards, '')
+                    ],
+                )
+                queued += cursor.rowcount
+        return queued
+
+    def claim(self, owner, limit, lease_time, exclude_hosts=()):
+        """Lease up to `limit` decks waiting to be fetched to `owner` for
+        `lease_time`, skipping any another worker holds, and any on
+        `exclude_hosts`. Leases which ran out without the deck being
+        fetched can be claimed again."""
+        now = timezone.now()
+        excluded = Q()
+        for host in exclude_hosts:
+            excluded |= Q(url__startswith=f'https://{host}/') | Q(url__startswith=f'http://{host}/')
+        with transaction.atomic():
+            ids = list(
+                self
+                .filter(fetchable=True, got_cards=False)
+                .filter(Q(lease_expires__isnull=True) | Q(lease_expires__lt=now))
+                .exclude(excluded)
+                .order_by('id')
+                .select_for_update(skip_locked=True)
+                .values_list('id', flat=True)[:limit]
+            )
+            self.filter(id__in=ids).update(
+                lease_owner=owner,
+                lease_expires=now + lease_time,
+            )
+        return list(
+            self
+            .filter(id__in=ids)
+            .select_related('deck')
+            .order_by('id')
+        )
+
+
 class DeckCrawlResult(models.Model):
+    objects = DeckCrawlResultQuerySet.as_manager()
+
     url = models.URLField()
     deck = models.ForeignKey(
         Deck,
@@ -36,10 +117,41 @@ class DeckCrawlResult(models.Model):
     updated_time = models.DateTimeField()
     fetchable = models.BooleanField(default=True)
     got_cards = models.BooleanField(default=False)
+    # transient failures (throttling, server errors, timeouts) we've
+    # retried while trying to fetch this deck
+    retries = models.IntegerField(default=0)
+    # which get-decklists worker is fetching this deck, and until when;
+    # a lease which runs out means the worker gave up or died
+    lease_owner = models.CharField(max_length=100, blank=True)
+    lease_expires = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.url}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('deck',),
+                name='one_crawl_result_per_deck',
+            ),
+        ]
+
+
+class BulkDataFetch(models.Model):
+    # metadata for a Scryfall bulk-data file we ingested completely,
+    # so that we can skip re-ingesting a file we've already seen
+    bulk_type = models.CharField(max_length=30)
+    updated_at = models.DateTimeField()
+    size = models.BigIntegerField()
+    download_uri = models.URLField(max_length=300)
+    ingested_time = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.bulk_type} ({self.updated_at})"
+
+    class Meta:
+        get_latest_by = 'ingested_time'
+
 
 class LogStart(models.Model):
     created = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,133 @@
+import json
+
+from django.db import connection
+from django.test import TestCase
+
+from crawler.card_parsing import parse_card_and_printing
+from crawler.card_ingest import CardBatchWriter, IngestPipeline
+from decklist.tests_factories import make_card
+from decklist.models import Card, Printing
+
+
+def _parse(filename):
+    with open(f'crawler/tests/{filename}') as f:
+        return parse_card_and_printing(json.load(f))
+
+
+class CardBatchWriterTestCase(TestCase):
+    def _write(self, *filenames):
+        writer = CardBatchWriter(lambda _: None, lambda _: None)
+        for filename in filenames:
+            writer.add(*_parse(filename))
+        writer.flush()
+        return writer
+
+    def test_inserts_new_rows(self):
+        writer = self._write('static-orb.json', 'ley-weaver.json')
+        self.assertEqual(writer.stats[Card]['inserted'], 2)
+        self.assertEqual(writer.stats[Printing]['inserted'], 2)
+        self.assertEqual(Card.objects.count(), 2)
+        self.assertEqual(Printing.objects.count(), 2)
+
+    def test_skips_unchanged_rows(self):
+        self._write('static-orb.json')
+        writer = self._write('static-orb.json')
+        self.assertEqual(writer.stats[Card]['unchanged'], 1)
+        self.assertEqual(writer.stats[Printing]['unchanged'], 1)
+        self.assertEqual(writer.rows_written, 0)
+
+    def test_updates_changed_rows(self):
+        self._write('static-orb.json')
+        Card.objects.update(name='Static Orb (stale)', content_hash='stale')
+        writer = self._write('static-orb.json')
+        self.assertEqual(writer.stats[Card]['updated'], 1)
+        self.assertEqual(writer.stats[Printing]['unchanged'], 1)
+        self.assertEqual(Card.objects.get().name, 'Static Orb')
+
+    def test_other_printings_dont_rewrite_card(self):
+        def printings():
+            for i in range(2):
+                c, p = _parse('static-orb.json')
+                p.id = f'00000000-0000-0000-0000-00000000000{i}'
+                p.set_code = f'set{i}'
+                c.scryfall_uri = f'https://scryfall.com/card/set{i}/1/static-orb'
+                yield c, p
+
+        for _ in range(2):
+            # each printing in its own flush, like a big bulk file
+            writer = CardBatchWriter(lambda _: None, lambda _: None, batch_size=1)
+            for c, p in printings():
+                writer.add(c, p)
+            writer.flush()
+
+        self.assertEqual(writer.stats[Card]['inserted'] + writer.stats[Card]['updated'], 0)
+        self.assertEqual(writer.rows_written, 0)
+        self.assertEqual(Card.objects.count(), 1)
+        self.assertEqual(Printing.objects.count(), 2)
+
+    def test_skips_printings_of_bad_cards(self):
+        writer = CardBatchWriter(lambda _: None, lambda _: None, batch_size=1)
+        for i in range(2):
+            c, p = _parse('static-orb.json')
+            # too long for the column
+            c.type_line = 'Artifact' * 20
+            p.id = f'00000000-0000-0000-0000-00000000000{i}'
+            writer.add(c, p)
+        writer.add(*_parse('ley-weaver.json'))
+        writer.flush()
+
+        # the later printing doesn't get written pointing at a missing card
+        connection.check_constraints()
+        self.assertEqual(list(Card.objects.values_list('name', flat=True)), ['Ley Weaver'])
+        self.assertEqual(Printing.objects.count(), 1)
+
+    def test_refreshes_rarity_flags(self):
+        self._write('static-orb.json', 'ley-weaver.json')
+        self.assertEqual(Card.objects.refresh_rarity_flags(), 1)
+        self.assertTrue(Card.objects.get(name='Ley Weaver').has_uncommon_printing)
+        self.assertFalse(Card.objects.get(name='Static Orb').has_common_printing)
+        # nothing changed, so nothing to touch
+        self.assertEqual(Card.objects.refresh_rarity_flags(), 0)
+
+    def test_refreshes_default_printings(self):
+        self._write('static-orb.json', 'ley-weaver.json')
+        # each card gets a default printing and its image
+        self.assertEqual(Card.objects.refresh_default_printings(), 4)
+        card = Card.objects.get(name='Static Orb')
+        printing = card.printings.get()
+        self.assertEqual(card.default_printing, printing)
+        self.assertEqual(card.image_uri, printing.image_uri)
+        self.assertEqual(Card.objects.refresh_default_printings(), 0)
+        # a card without printings has nothing to change either
+        make_card('No Printings')
+        self.assertEqual(Card.objects.refresh_default_printings(), 0)
+
+        Printing.objects.update(image_uri='https://example.com/new.jpg')
+        self.assertEqual(Card.objects.refresh_default_printings(), 2)
+        self.assertEqual(Card.objects.get(name='Static Orb').image_uri, 'https://example.com/new.jpg')
+
+
+class IngestPipelineTestCase(TestCase):
+    def test_inline_pipeline(self):
+        raw_cards = []
+        for filename in (
+            'static-orb.json',
+            'ley-weaver.json',
+            # unwanted layout
+            'propaganda-propaganda.json',
+            # fails to parse
+            '_bogus02-no-id.json',
+        ):
+            with open(f'crawler/tests/{filename}', 'rb') as f:
+                raw_cards.append(f.read())
+
+        errors = []
+        writer = CardBatchWriter(lambda _: None, errors.append)
+        pipeline = IngestPipeline(writer, errors.append, workers=0)
+        pipeline.run(raw_cards)
+
+        self.assertEqual(pipeline.read_stage.items, 4)
+        self.assertEqual(pipeline.parse_stage.items, 3)
+        self.assertEqual(pipeline.write_stage.items, 2)
+        self.assertEqual(writer.stats[Printing]['inserted'], 2)
+        self.assertGreater(len(errors), 0)
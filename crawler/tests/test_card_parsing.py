@@ -4,7 +4,7 @@ from pathlib import Path
 
 from django.test import TestCase
 
-from crawler.card_parsing import parse_card_and_printing, FailedToParseCard
+from crawler.card_parsing import parse_card_and_printing, parse_subtypes, FailedToParseCard
 from decklist.models import Rarity, PartnerType
 
 
@@ -22,6 +22,7 @@ class CardParsingTestCase(TestCase):
         self.assertEqual(c.identity_r, False)
         self.assertEqual(c.identity_g, False)
         self.assertEqual(c.type_line, "Artifact")
+        self.assertEqual(c.subtypes, [])
         self.assertEqual(c.partner_type, PartnerType.NONE)
         # printing
         self.assertEqual(p.id, "86bf43b1-8d4e-4759-bb2d-0b2e03ba7012")
@@ -62,6 +63,7 @@ class CardParsingTestCase(TestCase):
         self.assertEqual(c.identity_r, False)
         self.assertEqual(c.identity_g, True)
         self.assertEqual(c.type_line, "Creature — Human Druid")
+        self.assertEqual(c.subtypes, ["Human", "Druid"])
         self.assertEqual(c.partner_type, PartnerType.PARTNER_WITH_WEAVER)
         # printing
         self.assertEqual(p.id, "2c7e9d68-d419-4ec5-97e9-2478ecb7007f")
@@ -69,6 +71,14 @@ class CardParsingTestCase(TestCase):
         self.assertEqual(p.rarity, Rarity.UNCOMMON)
         self.assertEqual(p.release_date, date(year=2018, month=6, day=8))
     
+    def test_subtypes(self):
+        self.assertEqual(parse_subtypes("Legendary Enchantment — Background"), ["Background"])
+        self.assertEqual(
+            parse_subtypes("Creature — Human Wizard // Creature — Human Insect"),
+            ["Human", "Wizard", "Insect"],
+        )
+        self.assertEqual(parse_subtypes("Instant // Sorcery"), [])
+
     def test_non_card(self):
         count = 0
         for bogus in Path('crawler/tests/').glob('_bogus*.json'):
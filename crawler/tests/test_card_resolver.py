@@ -0,0 +1,37 @@
+import json
+
+from django.test import TestCase
+
+from crawler.card_parsing import parse_card_and_printing
+from crawler.card_ingest import CardBatchWriter
+from crawler.card_resolver import PrintingResolver, CardNotFound
+from decklist.models import Card
+
+
+class PrintingResolverTestCase(TestCase):
+    def setUp(self):
+        writer = CardBatchWriter(lambda _: None, lambda _: None)
+        for filename in ('static-orb.json', 'ley-weaver.json'):
+            with open(f'crawler/tests/{filename}') as f:
+                writer.add(*parse_card_and_printing(json.load(f)))
+        writer.flush()
+        self.static_orb = Card.objects.get(name='Static Orb')
+
+    def test_resolves_by_printing(self):
+        with self.assertNumQueries(1):
+            resolver = PrintingResolver()
+        with self.assertNumQueries(0):
+            card_id = resolver.card_for_printing('86bf43b1-8d4e-4759-bb2d-0b2e03ba7012')
+        self.assertEqual(card_id, self.static_orb.id)
+        self.assertIsNone(resolver.card_for_printing('not-a-uuid'))
+        self.assertEqual(resolver.printing_hits, 1)
+
+    def test_resolves_by_name_and_set(self):
+        resolver = PrintingResolver()
+        self.assertEqual(resolver.lookup_card('static orb', '7ED'), self.static_orb.id)
+        with self.assertRaises(CardNotFound):
+            resolver.lookup_card('Static Orb', 'm21')
+        # some sets only resolve by name
+        self.assertEqual(resolver.lookup_card('Static Orb', 'j21'), self.static_orb.id)
+        self.assertEqual(resolver.name_hits, 2)
+        self.assertEqual(resolver.misses, 1)
@@ -0,0 +1,63 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from decklist.tests_factories import make_card, make_deck
+from decklist.models import Commander, Deck
+
+
+class ComputeCommandersTestCase(TestCase):
+    def setUp(self):
+        self.green = make_card('Green', identity_g=True)
+        self.blue = make_card('Blue', identity_u=True)
+        self.red = make_card('Red', identity_r=True)
+        self.existing = Commander.objects.create(commander1=self.green)
+
+        self.solo = make_deck('solo', [self.green], pdh_legal=True)
+        self.pair = make_deck('pair', [self.red, self.blue], pdh_legal=True)
+        self.too_many = make_deck('too many', [self.green, self.blue, self.red], pdh_legal=True)
+        self.none = make_deck('none', pdh_legal=True)
+
+    def _run(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('compute-commanders', '--no-db', *args, stdout=out, stderr=err)
+        self.out = out.getvalue()
+        return err.getvalue()
+
+    def test_compute(self):
+        err = self._run()
+
+        self.solo.refresh_from_db()
+        self.assertEqual(self.solo.commander, self.existing)
+
+        self.pair.refresh_from_db()
+        pair = self.pair.commander
+        self.assertEqual(
+            {pair.commander1, pair.commander2},
+            {self.blue, self.red},
+        )
+        self.assertLess(pair.commander1_id, pair.commander2_id)
+        self.assertEqual(pair.identity, 2 | 8)
+        # the same as creating it one at a time would have given
+        self.assertEqual(pair.sfid, Commander(commander1=pair.commander1, commander2=pair.commander2)._compute_sfid())
+
+        self.assertEqual(Commander.objects.count(), 2)
+        self.assertIn('too many', err)
+        self.assertIn('none', err)
+
+    def test_all(self):
+        Deck.objects.filter(pk=self.pair.pk).update(commander=self.existing)
+        self._run()
+        self.assertEqual(Deck.objects.get(pk=self.pair.pk).commander, self.existing)
+
+        self._run('--all')
+        self.assertNotEqual(Deck.objects.get(pk=self.pair.pk).commander, self.existing)
+
+    def test_counts_only_new_commanders(self):
+        # as if another run created the solo commander after we looked
+        with mock.patch.object(Commander.objects, 'values_list', return_value=[]):
+            self._run()
+        self.assertIn("Created 1 commanders", self.out)
+        self.assertEqual(Commander.objects.count(), 2)
@@ -0,0 +1,62 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from decklist.tests_factories import make_card, make_deck
+from decklist.models import Commander, Deck, Theme, ThemeResult
+
+
+class ComputeThemesTestCase(TestCase):
+    def setUp(self):
+        goblins = [make_card(f'Goblin {i}', 'Creature — Goblin Warrior') for i in range(3)]
+        self.theme = Theme.objects.create(
+            display_name='Test Goblins', filter_text='Goblin', filter_type=Theme.Type.TYPAL,
+            slug='test-goblins', card_threshold=2, deck_threshold=50,
+        )
+
+        goblin_boss = make_card('Goblin Boss')
+        someone_else = make_card('Someone Else')
+        self.goblin_cmdr = Commander.objects.create(commander1=goblin_boss)
+        self.other_cmdr = Commander.objects.create(commander1=someone_else)
+
+        self.goblin_decks = [
+            make_deck(f'goblins {i}', [goblin_boss], goblins, commander=self.goblin_cmdr, pdh_legal=True)
+            for i in range(2)
+        ]
+        self.other_deck = make_deck('other', [someone_else], goblins[:1], commander=self.other_cmdr, pdh_legal=True)
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command('compute-themes', '--no-db', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def _result(self):
+        return (
+            ThemeResult.objects
+            .filter(theme=self.theme, commander=self.goblin_cmdr)
+            .values_list('theme_deck_count', 'total_deck_count')
+            .first()
+        )
+
+    def test_only_recomputes_changed_commanders(self):
+        self.assertIn("Recomputing 2 of 2 commanders", self._run())
+        self.assertEqual(self._result(), (2, 2))
+
+        self.assertIn("Recomputing 0 of 2 commanders", self._run())
+
+        # one goblin deck goes illegal, so the theme drops below 2 decks
+        Deck.objects.filter(pk=self.goblin_decks[0].pk).update(pdh_legal=False)
+        self.assertIn("Recomputing 1 of 2 commanders", self._run())
+        self.assertIsNone(self._result())
+
+    def test_recomputes_when_decks_go_away(self):
+        self._run()
+        self.goblin_decks[1].delete()
+        self.assertIn("Recomputing 1 of 2 commanders", self._run())
+        self.assertIsNone(self._result())
+
+    def test_full(self):
+        self._run()
+        self.assertIn("Recomputing 2 of 2 commanders", self._run('--full'))
+        self.assertEqual(self._result(), (2, 2))
@@ -0,0 +1,110 @@
+import importlib
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase
+
+from crawler.crawl_runner import CrawlRunner
+from crawler.crawlers import CrawlerExit
+from crawler.models import CrawlRun
+from decklist.models import DataSource
+
+
+crawl_all = importlib.import_module('crawler.management.commands.crawl-all')
+
+
+def _crawler(datasource, *steps):
+    """A stand-in crawler class which walks through `steps`: a URL is a
+    page it got (and where it would go next), an exception is raised."""
+    class FakeCrawler:
+        DATASOURCE = datasource
+        API_BASE = 'https://example.com/'
+        started_from = []
+
+        def __init__(self, client, initial_url, stop_after, write):
+            self.started_from.append(initial_url)
+            self.url = initial_url
+            self._steps = iter(steps)
+
+        def get_next_page(self):
+            step = next(self._steps, None)
+            if step is None:
+                return False
+            if isinstance(step, Exception):
+                raise step
+            self.url = step
+            return True
+
+        def report(self):
+            return "crawled"
+
+    return FakeCrawler
+
+
+class CrawlRunnerTestCase(TestCase):
+    def _run(self, crawler_class):
+        runner = CrawlRunner(
+            crawler_class, {}, lambda _: None, lambda _: None,
+            echo=lambda _: None, echo_err=lambda _: None,
+        )
+        runner.run()
+
+    def test_transient_exit_keeps_checkpoint(self):
+        crawler_class = _crawler(
+            DataSource.ARCHIDEKT,
+            'https://example.com/page-2',
+            CrawlerExit("timed out", transient=True),
+        )
+        with self.assertRaises(CrawlerExit):
+            self._run(crawler_class)
+
+        run = CrawlRun.objects.get()
+        self.assertEqual(run.state, CrawlRun.State.FETCHING_DECKS)
+        self.assertEqual(run.next_fetch, 'https://example.com/page-2')
+        self.assertEqual(run.note, "timed out")
+
+        # the next crawl picks up from there
+        resumed_class = _crawler(DataSource.ARCHIDEKT)
+        self._run(resumed_class)
+        self.assertEqual(resumed_class.started_from, ['https://example.com/page-2'])
+        self.assertEqual(CrawlRun.objects.get().state, CrawlRun.State.COMPLETE)
+
+    def test_permanent_exit_is_an_error(self):
+        with self.assertRaises(CrawlerExit):
+            self._run(_crawler(DataSource.ARCHIDEKT, CrawlerExit("bad request")))
+
+        run = CrawlRun.objects.get()
+        self.assertEqual(run.state, CrawlRun.State.ERROR)
+        self.assertEqual(run.note, "bad request")
+
+
+# the crawls run on their own threads, with their own connections, so
+# their writes have to be committed for us to see them
+class CrawlAllTestCase(TransactionTestCase):
+    def test_one_source_failing(self):
+        fetcher = mock.Mock()
+        fetcher.run_queue.return_value = 0
+        fetcher.retry_after.return_value = 0
+        fetcher.report.return_value = []
+
+        with (
+            mock.patch.object(crawl_all, 'ArchidektCrawler', _crawler(DataSource.ARCHIDEKT, CrawlerExit("bad request"))),
+            mock.patch.object(crawl_all, 'MoxfieldCrawler', _crawler(DataSource.MOXFIELD, 'https://example.com/page-2')),
+            mock.patch.object(crawl_all, 'MOXFIELD_HEADERS', {'User-Agent': 'test'}),
+            mock.patch.object(crawl_all, 'DecklistFetcher', return_value=fetcher),
+            self.assertRaisesMessage(CommandError, "Archidekt failed"),
+        ):
+            call_command('crawl-all', '--no-db', stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(
+            CrawlRun.objects.get(target=DataSource.ARCHIDEKT).state,
+            CrawlRun.State.ERROR,
+        )
+        # the other source carried on regardless
+        self.assertEqual(
+            CrawlRun.objects.get(target=DataSource.MOXFIELD).state,
+            CrawlRun.State.COMPLETE,
+        )
+        fetcher.run_queue.assert_called()
@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+
+from django.test import TestCase
+
+from crawler.crawlers import ArchidektCrawler
+from crawler.models import DeckCrawlResult
+from decklist.tests_factories import make_card
+from decklist.models import Commander, Deck
+
+
+def _archidekt_deck(deck_id, name='Some deck', updated_at='2024-05-01T12:00:00Z'):
+    return {
+        'id': deck_id,
+        'name': name,
+        'updatedAt': updated_at,
+        'owner': {'username': 'someone'},
+    }
+
+
+class ProcessPageTestCase(TestCase):
+    def setUp(self):
+        self.crawler = ArchidektCrawler(None, 'https://archidekt.com/api/decks/v3/', None, lambda _: None)
+
+    def test_inserts_updates_and_skips(self):
+        page = [_archidekt_deck(1), _archidekt_deck(2), _archidekt_deck(3)]
+        self.crawler._process_page(page, None)
+        self.assertEqual(Deck.objects.count(), 3)
+        self.assertEqual(DeckCrawlResult.objects.count(), 3)
+
+        page[1] = _archidekt_deck(2, name='Renamed deck', updated_at='2024-05-02T12:00:00Z')
+        with self.assertNumQueries(5):
+            # look up, one update, and one queued crawl inside a transaction
+            self.crawler._process_page(page, None)
+        self.assertEqual(Deck.objects.get(source_id='2').name, 'Renamed deck')
+        # the deck was still queued, so its entry was updated
+        self.assertEqual(DeckCrawlResult.objects.count(), 3)
+        self.assertEqual(
+            DeckCrawlResult.objects.get(deck__source_id='2').updated_time.day,
+            2,
+        )
+        self.assertEqual(self.crawler.decks_written, 4)
+        self.assertEqual(self.crawler.decks_unchanged, 2)
+
+    def test_stops_at_stop_after(self):
+        page = [
+            _archidekt_deck(1, updated_at='2024-05-03T12:00:00Z'),
+            _archidekt_deck(2, updated_at='2024-05-01T12:00:00Z'),
+        ]
+        oldest_seen = self.crawler._process_page(page, datetime(2024, 5, 2, tzinfo=timezone.utc))
+        self.assertEqual(list(Deck.objects.values_list('source_id', flat=True)), ['1'])
+        self.assertEqual(oldest_seen.day, 1)
+
+    def test_keeps_commander(self):
+        self.crawler._process_page([_archidekt_deck(1)], None)
+        commander = Commander.objects.create(commander1=make_card('Some commander'))
+        Deck.objects.update(commander=commander)
+
+        # a rename alone doesn't change the cards, so the fetcher will
+        # skip the deck; it needs to keep its commander
+        self.crawler._process_page([_archidekt_deck(1, name='Renamed deck', updated_at='2024-05-02T12:00:00Z')], None)
+        self.assertEqual(Deck.objects.get().commander, commander)
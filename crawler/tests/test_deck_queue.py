@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from crawler.models import DeckCrawlResult
+from decklist.models import Deck, DataSource
+
+
+LEASE_TIME = timedelta(minutes=10)
+
+
+class EnqueueTestCase(TestCase):
+    def test_one_entry_per_deck(self):
+        now = timezone.now()
+        deck = Deck.objects.create(
+            name='Deck',
+            source=DataSource.ARCHIDEKT,
+            source_id='1',
+            updated_time=now,
+        )
+        DeckCrawlResult.objects.enqueue([
+            DeckCrawlResult(url='https://example.com/1', deck=deck, updated_time=now),
+        ])
+        DeckCrawlResult.objects.filter(deck=deck).update(
+            fetchable=False,
+            retries=3,
+            lease_owner='worker-1',
+            lease_expires=now + LEASE_TIME,
+        )
+
+        later = now + timedelta(hours=1)
+        queued = DeckCrawlResult.objects.enqueue([
+            DeckCrawlResult(url='https://example.com/1', deck=deck, updated_time=later),
+        ])
+        self.assertEqual(queued, 1)
+        crawl_result = DeckCrawlResult.objects.get()
+        self.assertEqual(crawl_result.updated_time, later)
+        # a newer version of the deck is worth another try, from scratch
+        self.assertTrue(crawl_result.fetchable)
+        self.assertEqual(crawl_result.retries, 0)
+        self.assertEqual(crawl_result.lease_owner, '')
+        self.assertIsNone(crawl_result.lease_expires)
+
+    def test_keeps_newest_crawl(self):
+        now = timezone.now()
+        deck = Deck.objects.create(
+            name='Deck',
+            source=DataSource.ARCHIDEKT,
+            source_id='1',
+            updated_time=now,
+        )
+        DeckCrawlResult.objects.enqueue([
+            DeckCrawlResult(url='https://example.com/new', deck=deck, updated_time=now),
+        ])
+        DeckCrawlResult.objects.filter(deck=deck).update(retries=2, lease_owner='worker-1')
+
+        earlier = now - timedelta(hours=1)
+        queued = DeckCrawlResult.objects.enqueue([
+            DeckCrawlResult(url='https://example.com/old', deck=deck, updated_time=earlier),
+        ])
+        self.assertEqual(queued, 0)
+        crawl_result = DeckCrawlResult.objects.get()
+        self.assertEqual(crawl_result.updated_time, now)
+        self.assertEqual(crawl_result.url, 'https://example.com/new')
+        # nothing changed, so the fetch in progress carries on
+        self.assertEqual(crawl_result.retries, 2)
+        self.assertEqual(crawl_result.lease_owner, 'worker-1')
+
+
+class ClaimTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for i in range(5):
+            deck = Deck.objects.create(
+                name=f'Deck {i}',
+                source=DataSource.ARCHIDEKT,
+                source_id=str(i),
+                updated_time=now,
+            )
+            DeckCrawlResult.objects.create(
+                url=f'https://archidekt.com/api/decks/{i}/',
+                deck=deck,
+                updated_time=now,
+            )
+
+    def test_workers_get_different_decks(self):
+        first = DeckCrawlResult.objects.claim('worker-1', 3, LEASE_TIME)
+        second = DeckCrawlResult.objects.claim('worker-2', 3, LEASE_TIME)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertTrue({c.id for c in first}.isdisjoint({c.id for c in second}))
+        self.assertEqual(DeckCrawlResult.objects.claim('worker-3', 3, LEASE_TIME), [])
+        self.assertEqual(first[0].lease_owner, 'worker-1')
+
+    def test_expired_leases_are_reclaimed(self):
+        DeckCrawlResult.objects.claim('worker-1', 5, LEASE_TIME)
+        DeckCrawlResult.objects.filter(deck__source_id='2').update(
+            lease_expires=timezone.now() - timedelta(seconds=1),
+        )
+        reclaimed = DeckCrawlResult.objects.claim('worker-2', 5, LEASE_TIME)
+        self.assertEqual([c.deck.source_id for c in reclaimed], ['2'])
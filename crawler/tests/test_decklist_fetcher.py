@@ -0,0 +1,215 @@
+import json
+import time
+from unittest import mock
+
+import httpx
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from crawler.card_parsing import parse_card_and_printing
+from crawler.card_ingest import CardBatchWriter
+from crawler import decklist_fetcher, throttling
+from crawler.decklist_fetcher import DecklistFetcher, LEASE_TIME, MAX_BREAKER_TRIPS
+from crawler.models import DeckCrawlResult, LogEntry
+from decklist.models import Card, CardInDeck, Deck, DataSource
+from decklist.models.deck import card_fingerprint
+
+
+class FingerprintTestCase(TestCase):
+    def setUp(self):
+        writer = CardBatchWriter(lambda _: None, lambda _: None)
+        for filename in ('static-orb.json', 'ley-weaver.json'):
+            with open(f'crawler/tests/{filename}') as f:
+                writer.add(*parse_card_and_printing(json.load(f)))
+        writer.flush()
+        Card.objects.refresh_rarity_flags()
+        self.static_orb = Card.objects.get(name='Static Orb')
+        self.ley_weaver = Card.objects.get(name='Ley Weaver')
+
+        now = timezone.now()
+        self.deck = Deck.objects.create(
+            name='Deck',
+            source=DataSource.ARCHIDEKT,
+            source_id='1',
+            updated_time=now,
+        )
+        self.crawl_result = DeckCrawlResult.objects.create(
+            url='https://example.com/1',
+            deck=self.deck,
+            updated_time=now,
+        )
+        self.fetcher = DecklistFetcher(lambda _: None, lambda _: None)
+
+    def test_order_doesnt_matter(self):
+        self.assertEqual(
+            card_fingerprint([(self.static_orb.id, False), (self.ley_weaver.id, True)]),
+            card_fingerprint([(self.ley_weaver.id, True), (self.static_orb.id, False)]),
+        )
+        self.assertNotEqual(
+            card_fingerprint([(self.static_orb.id, False), (self.ley_weaver.id, True)]),
+            card_fingerprint([(self.static_orb.id, True), (self.ley_weaver.id, False)]),
+        )
+
+    def test_skips_unchanged_deck(self):
+        deck_cards = {self.ley_weaver.id: True, self.static_orb.id: False}
+        self.fetcher._save_deck(self.crawl_result, deck_cards)
+        self.assertEqual(CardInDeck.objects.filter(deck=self.deck).count(), 2)
+        self.deck.refresh_from_db()
+        self.assertEqual(self.deck.card_fingerprint, self.deck.compute_card_fingerprint())
+        cards_updated_time = self.deck.cards_updated_time
+        self.assertIsNotNone(cards_updated_time)
+
+        self.crawl_result.deck = self.deck
+        self.crawl_result.got_cards = False
+        with self.assertNumQueries(0):
+            self.fetcher._save_deck(self.crawl_result, dict(reversed(deck_cards.items())))
+        self.assertTrue(self.crawl_result.got_cards)
+        self.assertEqual(self.fetcher.decks_unchanged, 1)
+
+        # a changed list gets written
+        self.fetcher._save_deck(self.crawl_result, {self.ley_weaver.id: True})
+        self.assertEqual(CardInDeck.objects.filter(deck=self.deck).count(), 1)
+        self.deck.refresh_from_db()
+        self.assertEqual(self.deck.card_fingerprint, self.deck.compute_card_fingerprint())
+        self.assertGreater(self.deck.cards_updated_time, cards_updated_time)
+
+    def test_summarizes_deck(self):
+        self.fetcher._save_deck(self.crawl_result, {self.ley_weaver.id: True})
+        self.deck.refresh_from_db()
+        self.assertTrue(self.deck.pdh_legal)
+        self.assertEqual(self.deck.identity, 16)
+        self.assertEqual(self.deck.card_count, 1)
+        self.assertEqual(self.deck.commander.commander1, self.ley_weaver)
+        self.assertIsNone(self.deck.commander.commander2)
+
+    def test_illegal_deck_loses_commander(self):
+        self.fetcher._save_deck(self.crawl_result, {self.ley_weaver.id: True})
+        self.deck.refresh_from_db()
+        self.assertIsNotNone(self.deck.commander)
+
+        # Static Orb isn't a creature, so it can't be the commander
+        self.crawl_result.deck = self.deck
+        self.fetcher._save_deck(self.crawl_result, {self.static_orb.id: True})
+        self.deck.refresh_from_db()
+        self.assertFalse(self.deck.pdh_legal)
+        self.assertIsNone(self.deck.commander)
+
+    def test_keeps_newer_crawl(self):
+        # requeued with a newer version of the deck while we fetched it
+        later = self.crawl_result.updated_time + LEASE_TIME
+        DeckCrawlResult.objects.enqueue([
+            DeckCrawlResult(url=self.crawl_result.url, deck=self.deck, updated_time=later),
+        ])
+
+        self.fetcher._give_up(self.crawl_result, "bad deck")
+        crawl_result = DeckCrawlResult.objects.get()
+        self.assertTrue(crawl_result.fetchable)
+        self.assertEqual(crawl_result.updated_time, later)
+
+
+class CircuitOpenTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for i in range(3):
+            deck = Deck.objects.create(
+                name=f'Deck {i}',
+                source=DataSource.ARCHIDEKT,
+                source_id=str(i),
+                updated_time=now,
+            )
+            DeckCrawlResult.objects.create(
+                url=f'https://archidekt.com/api/decks/{i}/',
+                deck=deck,
+                updated_time=now,
+            )
+        self.fetcher = DecklistFetcher(lambda _: None, lambda _: None)
+        self.throttle = throttling.throttle_for_host('archidekt.com')
+        self.throttle.breaker._open_until = time.monotonic() + 60
+        self.throttle.breaker.trips = 1
+
+    def tearDown(self):
+        # throttles are shared across the process
+        throttling._throttles.pop('archidekt.com', None)
+
+    def test_releases_unattempted_decks(self):
+        batch = DeckCrawlResult.objects.claim(self.fetcher.worker, 3, LEASE_TIME)
+        self.fetcher.run(batch)
+        self.assertFalse(DeckCrawlResult.objects.filter(lease_expires__isnull=False).exists())
+
+    def test_waits_out_open_breaker(self):
+        self.fetcher.throttles['archidekt.com'] = self.throttle
+        self.assertEqual(self.fetcher.run_queue(), 0)
+        self.assertGreater(self.fetcher.retry_after(), 0)
+        # nothing got leased while we couldn't fetch it
+        self.assertFalse(DeckCrawlResult.objects.filter(lease_expires__isnull=False).exists())
+
+    def test_gives_up_on_host(self):
+        self.fetcher.throttles['archidekt.com'] = self.throttle
+        self.throttle.breaker.trips = MAX_BREAKER_TRIPS
+        self.assertEqual(self.fetcher.run_queue(), 0)
+        self.assertEqual(self.fetcher.retry_after(), 0)
+
+
+class BadDeckTestCase(TransactionTestCase):
+    # the database work happens on other threads, which can't see
+    # inside a TestCase's transaction
+    RESPONSES = {
+        'good': httpx.Response(200, json={'cards': [], 'categories': []}),
+        'bad envelope': httpx.Response(200, json={'deck': None}),
+        'not json': httpx.Response(200, text='<html>oops</html>'),
+    }
+
+    def setUp(self):
+        now = timezone.now()
+        for i, name in enumerate(self.RESPONSES):
+            deck = Deck.objects.create(
+                name=name,
+                source=DataSource.ARCHIDEKT,
+                source_id=str(i),
+                updated_time=now,
+            )
+            DeckCrawlResult.objects.create(
+                url=f'https://archidekt.com/api/decks/{i}/',
+                deck=deck,
+                updated_time=now,
+            )
+
+        by_url = {
+            f'https://archidekt.com/api/decks/{i}/': response
+            for i, response in enumerate(self.RESPONSES.values())
+        }
+        real_client = httpx.AsyncClient
+        self.enterContext(mock.patch.object(
+            decklist_fetcher.httpx,
+            'AsyncClient',
+            lambda **kwargs: real_client(
+                transport=httpx.MockTransport(lambda request: by_url[str(request.url)]),
+                **kwargs,
+            ),
+        ))
+        self.fetcher = DecklistFetcher(lambda _: None, lambda _: None)
+
+    def tearDown(self):
+        # throttles are shared across the process
+        throttling._throttles.pop('archidekt.com', None)
+
+    def test_bad_decks_dont_stop_the_batch(self):
+        self.assertEqual(self.fetcher.run_queue(), 3)
+
+        self.assertEqual(self.fetcher.decks_fetched, 1)
+        self.assertFalse(DeckCrawlResult.objects.filter(deck__name='good').exists())
+        self.assertEqual(
+            set(DeckCrawlResult.objects.filter(fetchable=False).values_list('deck__name', flat=True)),
+            {'bad envelope', 'not json'},
+        )
+
+    def test_logs_errors_off_the_event_loop(self):
+        # like LoggingBaseCommand, which writes its logs to the database
+        log = lambda text: LogEntry.objects.create(text=text)
+        fetcher = DecklistFetcher(log, log)
+
+        with mock.patch.object(fetcher, '_save_deck', side_effect=RuntimeError("database went away")):
+            self.assertEqual(fetcher.run_queue(), 3)
+
+        self.assertTrue(LogEntry.objects.filter(text__contains="database went away").exists())
+        self.assertFalse(DeckCrawlResult.objects.filter(fetchable=True).exists())
@@ -0,0 +1,222 @@
+import gzip
+import importlib
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import httpx
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils.dateparse import parse_datetime
+
+from crawler.models import BulkDataFetch
+from decklist.models import BannedCard, Card, Printing
+from decklist.models.bannedcard import INITIAL_BAN_LIST
+
+
+fetch_cards = importlib.import_module('crawler.management.commands.fetch-cards')
+_real_client = httpx.Client
+
+CARD_FILES = ('static-orb.json', 'ley-weaver.json')
+DOWNLOAD_URI = 'https://data.scryfall.io/default-cards/default-cards-20240501090000.json'
+
+
+def _json_cards():
+    cards = []
+    for filename in CARD_FILES:
+        with open(f'crawler/tests/{filename}') as f:
+            cards.append(json.load(f))
+    return cards
+
+
+def _one_card_per_line():
+    # the way Scryfall writes its bulk files
+    lines = ',\n'.join(json.dumps(card) for card in _json_cards())
+    return f'[\n{lines}\n]\n'.encode()
+
+
+def _pretty():
+    return json.dumps(_json_cards(), indent=2).encode()
+
+
+class FetchCardsTestCase(TestCase):
+    def setUp(self):
+        self.tmp = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(BULK_DATA_CACHE_DIR=self.tmp / 'cache'))
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command('fetch-cards', '--no-db', '--workers', '0', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def _scryfall(self, bulk_data, bulk_file=None, status_code=200):
+        """Point fetch-cards at a fake Scryfall serving `bulk_data` as the
+        bulk file's metadata, and `bulk_file` as its contents. Returns the
+        requests it gets."""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            if str(request.url) == DOWNLOAD_URI:
+                return httpx.Response(status_code, content=bulk_file)
+            return httpx.Response(200, json=bulk_data)
+
+        self.enterContext(mock.patch.object(
+            fetch_cards.httpx,
+            'Client',
+            lambda **kwargs: _real_client(transport=httpx.MockTransport(handler), **kwargs),
+        ))
+        return requests
+
+    def _bulk_data(self, bulk_file):
+        return {
+            'updated_at': '2024-05-01T09:00:00.000+00:00',
+            'size': len(bulk_file),
+            'download_uri': DOWNLOAD_URI,
+        }
+
+
+class FromFileTestCase(FetchCardsTestCase):
+    def _write(self, name, contents, gzipped):
+        path = self.tmp / name
+        with (gzip.open if gzipped else open)(path, 'wb') as f:
+            f.write(contents)
+        return path
+
+    def test_layouts(self):
+        for layout, contents in (('one card per line', _one_card_per_line()), ('pretty', _pretty())):
+            for gzipped in (False, True):
+                with self.subTest(layout=layout, gzipped=gzipped):
+                    Printing.objects.all().delete()
+                    Card.objects.all().delete()
+                    path = self._write('cards.json', contents, gzipped)
+
+                    out = self._run('--from-file', str(path))
+
+                    self.assertEqual(Card.objects.count(), 2)
+                    self.assertEqual(Printing.objects.count(), 2)
+                    # only the fallback decodes JSON on the reader
+                    self.assertEqual(
+                        "isn't one card per line" in out,
+                        layout == 'pretty',
+                    )
+
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            self._run('--from-file', str(self.tmp / 'nope.json'))
+
+    def test_empty_file(self):
+        path = self._write('cards.json', b'', False)
+        with self.assertRaisesMessage(CommandError, 'is empty'):
+            self._run('--from-file', str(path))
+
+    def test_bans_initial_ban_list(self):
+        [template] = [card for card in _json_cards() if card['name'] == 'Static Orb']
+        json_cards = []
+        for n, (name, _, _) in enumerate(INITIAL_BAN_LIST):
+            json_card = dict(template, name=name)
+            json_card['id'] = f"00000000-0000-0000-0000-{n:012}"
+            json_card['oracle_id'] = f"11111111-0000-0000-0000-{n:012}"
+            json_cards.append(json_card)
+        path = self._write('cards.json', json.dumps(json_cards).encode(), False)
+
+        for _ in range(2):
+            self._run('--from-file', str(path))
+
+            bans = {
+                ban.card.name: ban.applies_as_commander_only
+                for ban in BannedCard.objects.select_related('card')
+            }
+            self.assertEqual(bans, {
+                name: commander_only
+                for name, commander_only, _ in INITIAL_BAN_LIST
+            })
+
+
+class DownloadTestCase(FetchCardsTestCase):
+    def test_caches_download(self):
+        bulk_file = _one_card_per_line()
+        requests = self._scryfall(self._bulk_data(bulk_file), bulk_file)
+
+        self._run()
+        cached = self.tmp / 'cache' / 'default-cards-20240501090000.json.gz'
+        with gzip.open(cached) as f:
+            self.assertEqual(f.read(), bulk_file)
+        self.assertEqual(Card.objects.count(), 2)
+
+        out = self._run('--force')
+        self.assertIn(f"Using cached {cached}", out)
+        downloads = [r for r in requests if str(r.url) == DOWNLOAD_URI]
+        self.assertEqual(len(downloads), 1)
+
+
+    def test_failed_download_leaves_no_partial_file(self):
+        bulk_file = _one_card_per_line()
+
+        def dropped_connection():
+            yield bulk_file[:10]
+            raise httpx.ReadError("connection reset")
+
+        self._scryfall(self._bulk_data(bulk_file), dropped_connection())
+
+        with self.assertRaises(httpx.ReadError):
+            self._run()
+        self.assertEqual(list((self.tmp / 'cache').iterdir()), [])
+
+
+class AlreadyIngestedTestCase(FetchCardsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bulk_file = _one_card_per_line()
+        self.bulk_data = self._bulk_data(self.bulk_file)
+
+    def _seed(self, **changes):
+        fields = {
+            'bulk_type': fetch_cards.BULK_TYPE,
+            'updated_at': parse_datetime(self.bulk_data['updated_at']),
+            'size': self.bulk_data['size'],
+            'download_uri': DOWNLOAD_URI,
+        } | changes
+        BulkDataFetch.objects.create(**fields)
+
+    def test_skips_same_version(self):
+        self._seed()
+        requests = self._scryfall(self.bulk_data, self.bulk_file)
+
+        out = self._run()
+        self.assertIn("hasn't changed", out)
+        self.assertEqual([str(r.url) for r in requests if str(r.url) == DOWNLOAD_URI], [])
+        self.assertEqual(Card.objects.count(), 0)
+        self.assertEqual(BulkDataFetch.objects.count(), 1)
+
+    def test_ingests_new_version(self):
+        self._seed(size=1)
+        self._scryfall(self.bulk_data, self.bulk_file)
+
+        self._run()
+        self.assertEqual(Card.objects.count(), 2)
+        self.assertEqual(BulkDataFetch.objects.latest().size, len(self.bulk_file))
+
+    def test_force(self):
+        self._seed()
+        self._scryfall(self.bulk_data, self.bulk_file)
+
+        self._run('--force')
+        self.assertEqual(Card.objects.count(), 2)
+        self.assertEqual(BulkDataFetch.objects.count(), 2)
+
+    def test_only_records_complete_ingest(self):
+        self._scryfall(self.bulk_data, status_code=500)
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            self._run()
+        self.assertFalse(BulkDataFetch.objects.exists())
+
+        # so the next run tries again
+        self._scryfall(self.bulk_data, self.bulk_file)
+        self._run()
+        self.assertEqual(Card.objects.count(), 2)
+        self.assertEqual(BulkDataFetch.objects.count(), 1)
@@ -0,0 +1,38 @@
+from django.test import TestCase
+
+from crawler.legality_recheck import LegalityRecheck
+from decklist.tests_factories import make_card, make_deck
+from decklist.models import Deck
+
+
+class LegalityRecheckTestCase(TestCase):
+    def setUp(self):
+        commander = make_card('Commander', identity_g=True)
+        forest = make_card('Forest', identity_g=True)
+        self.bolt = make_card('Bolt', identity_r=True)
+
+        self.legal = make_deck('Legal', [commander], [forest], pdh_legal=False)
+        self.off_color = make_deck('Off color', [commander], [forest, self.bolt], pdh_legal=True)
+        self.unchanged = make_deck('Unchanged', [commander], [forest], pdh_legal=True)
+
+    def test_recheck(self):
+        # small chunks, to make sure nothing falls between them
+        recheck = LegalityRecheck(lambda _: None, workers=0, chunk_size=2)
+        recheck.run(Deck.objects.all())
+
+        self.assertEqual(recheck.decks_checked, 3)
+        self.assertEqual(recheck.decks_changed, 2)
+        self.assertEqual(
+            set(Deck.objects.filter(pdh_legal=True)),
+            {self.legal, self.unchanged},
+        )
+
+    def test_recheck_some(self):
+        recheck = LegalityRecheck(lambda _: None, workers=0)
+        recheck.run(Deck.objects.filter(card_list__card=self.bolt))
+
+        self.assertEqual(recheck.decks_checked, 1)
+        self.assertEqual(
+            set(Deck.objects.filter(pdh_legal=True)),
+            {self.unchanged},
+        )
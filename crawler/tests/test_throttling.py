@@ -0,0 +1,115 @@
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from django.test import SimpleTestCase
+
+from crawler.throttling import (
+    CircuitBreaker,
+    CircuitOpen,
+    HostThrottle,
+    RequestFailed,
+    TokenBucket,
+    retry_after_seconds,
+)
+
+
+def _responses(*items):
+    # a `send()` which gives back each of `items` in turn
+    items = iter(items)
+    def send():
+        item = next(items)
+        if isinstance(item, Exception):
+            raise item
+        return item
+    return send
+
+
+class TokenBucketTestCase(SimpleTestCase):
+    def test_bursts_then_waits(self):
+        bucket = TokenBucket('test', rate=10, capacity=2)
+        self.assertEqual(bucket._reserve(), 0.0)
+        self.assertEqual(bucket._reserve(), 0.0)
+        # the bucket is empty, so each further request waits one
+        # more refill interval than the last
+        self.assertAlmostEqual(bucket._reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket._reserve(), 0.2, delta=0.01)
+        self.assertEqual(bucket.acquired, 4)
+
+    def test_pause(self):
+        bucket = TokenBucket('test', rate=10, capacity=2)
+        bucket.pause(1)
+        self.assertAlmostEqual(bucket._reserve(), 1.1, delta=0.01)
+
+
+class RetryAfterTestCase(SimpleTestCase):
+    def test_seconds(self):
+        response = httpx.Response(429, headers={'Retry-After': '7'})
+        self.assertEqual(retry_after_seconds(response), 7.0)
+
+    def test_http_date(self):
+        when = datetime.now(timezone.utc) + timedelta(seconds=30)
+        response = httpx.Response(503, headers={'Retry-After': format_datetime(when, usegmt=True)})
+        self.assertAlmostEqual(retry_after_seconds(response), 30, delta=2)
+
+    def test_capped(self):
+        response = httpx.Response(429, headers={'Retry-After': '86400'})
+        self.assertEqual(retry_after_seconds(response), 60.0)
+        when = datetime.now(timezone.utc) + timedelta(days=365)
+        response = httpx.Response(503, headers={'Retry-After': format_datetime(when, usegmt=True)})
+        self.assertEqual(retry_after_seconds(response), 60.0)
+
+    def test_missing_or_garbage(self):
+        self.assertIsNone(retry_after_seconds(httpx.Response(429)))
+        self.assertIsNone(retry_after_seconds(httpx.Response(429, headers={'Retry-After': 'soon'})))
+
+
+class HostThrottleTestCase(SimpleTestCase):
+    def _throttle(self, **kwargs):
+        return HostThrottle('example.com', rate=1000, burst=10, backoff_base=0.001, **kwargs)
+
+    def test_retries_transient_failures(self):
+        throttle = self._throttle()
+        response, retries = throttle.request(_responses(
+            httpx.Response(429, headers={'Retry-After': '0'}),
+            httpx.ConnectTimeout('slow'),
+            httpx.Response(502),
+            httpx.Response(200),
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(retries, 3)
+
+    def test_permanent_failures_come_straight_back(self):
+        throttle = self._throttle()
+        response, retries = throttle.request(_responses(httpx.Response(404)))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(retries, 0)
+
+    def test_gives_up(self):
+        throttle = self._throttle(max_retries=1)
+        response, retries = throttle.request(_responses(
+            httpx.Response(500),
+            httpx.Response(503),
+        ))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(retries, 1)
+
+        with self.assertRaises(RequestFailed) as cm:
+            throttle.request(_responses(
+                httpx.ConnectError('nope'),
+                httpx.ConnectError('still nope'),
+            ))
+        self.assertEqual(cm.exception.retries, 1)
+
+    def test_circuit_breaker(self):
+        throttle = self._throttle(
+            max_retries=5,
+            breaker=CircuitBreaker(threshold=2, cooldown=60),
+        )
+        with self.assertRaises(CircuitOpen) as cm:
+            throttle.request(_responses(httpx.Response(500), httpx.Response(500)))
+        self.assertEqual(cm.exception.retries, 2)
+
+        # later requests don't even go out
+        with self.assertRaises(CircuitOpen):
+            throttle.request(_responses())
@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+
+# how hard we're willing to hit each host: requests per second,
+# how many of those may come in a burst, and how many may be in flight
+HOST_LIMITS = {
+    'archidekt.com': {'rate': 2, 'burst': 4, 'concurrency': 4},
+    'api2.moxfield.com': {'rate': 1, 'burst': 1, 'concurrency': 2},
+}
+DEFAULT_HOST_LIMITS = {'rate': 0.5, 'burst': 1, 'concurrency': 1}
+
+# worth another try later; anything else that isn't a success is
+# the server telling us the request itself is no good
+TRANSIENT_STATUS_CODES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+
+class RequestFailed(Exception):
+    "Gave up on a request without getting a response"
+    def __init__(self, *args, retries=0):
+        super().__init__(*args)
+        self.retries = retries
+
+
+class CircuitOpen(RequestFailed): ...
+
+
+def is_transient(response: httpx.Response):
+    return response.status_code in TRANSIENT_STATUS_CODES
+
+
+def retry_after_seconds(response: httpx.Response, cap=60.0):
+    """Seconds the server asked us to wait, up to `cap`, or None if it
+    didn't say. A bad header shouldn't hold up a host for hours."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+
+    try:
+        return min(cap, max(0.0, float(value)))
+    except ValueError:
+        pass
+
+    # it can also be an HTTP date
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return min(cap, max(0.0, (when - datetime.now(timezone.utc)).total_seconds()))
+
+
+def backoff_seconds(attempt, base=1.0, cap=60.0):
+    "Exponential backoff with full jitter"
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """Rate limiter allowing `rate` requests per second, with bursts of
+    up to `capacity` requests.
+
+    Safe to share between threads. Use `acquire()` from sync code and
+    `acquire_async()` from a coroutine."""
+
+    def __init__(self, name, rate, capacity=1):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def _reserve(self):
+        # take a token, possibly one that hasn't been refilled yet, and
+        # return how long to wait until it has been
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            self.acquired += 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited_seconds += wait
+            return wait
+
+    def pause(self, seconds):
+        "Hold off everyone using this bucket for at least `seconds`"
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def acquire(self):
+        if wait := self._reserve():
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        if wait := self._reserve():
+            await asyncio.sleep(wait)
+
+    def report(self):
+        average = self.waited_seconds / self.acquired if self.acquired else 0.0
+        return (
+            f"{self.name}: {self.acquired} requests at up to {self.rate:g}/sec, "
+            f"waited {self.waited_seconds:.1f}s ({average:.2f}s each)"
+        )
+
+
+class CircuitBreaker:
+    """Stops requests to a host for `cooldown` seconds once `threshold`
+    of them in a row have failed. After the cooldown, one more failure
+    opens it again."""
+
+    def __init__(self, threshold=5, cooldown=60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    def open_for(self):
+        "Seconds until requests are allowed again"
+        return max(0.0, self._open_until - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._open_until = time.monotonic() + self.cooldown
+                self._failures = self.threshold - 1
+                self.trips += 1
+
+
+class HostThrottle:
+    """Rate limiting, retries, and a circuit breaker for one host.
+
+    Transient failures (see TRANSIENT_STATUS_CODES, plus timeouts and
+    connection errors) are retried with exponential backoff, honoring
+    Retry-After. Other responses come straight back to the caller."""
+
+    def __init__(self, host, rate, burst=1, max_retries=4, backoff_base=1.0, breaker=None):
+        self.host = host
+        self.limiter = TokenBucket(host, rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.retries = 0
+
+    def request(self, send):
+        """Call `send()` until its response is worth handling, and return
+        (response, number of retries). If the host never gives us one,
+        raises RequestFailed."""
+        for attempt in itertools.count():
+            self._check_breaker(attempt)
+            self.limiter.acquire()
+            try:
+                response = send()
+            except httpx.TransportError as e:
+                delay = self._retry_delay(attempt, None)
+                if delay is None:
+                    raise RequestFailed(f"{self.host}: {e!r}", retries=attempt) from e
+            else:
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    return response, attempt
+            time.sleep(delay)
+
+    async def request_async(self, send):
+        "Same as `request()`, for a `send()` which returns an awaitable"
+        for attempt in itertools.count():
+            self._check_breaker(attempt)
+            await self.limiter.acquire_async()
+            try:
+                response = await send()
+            except httpx.TransportError as e:
+                delay = self._retry_delay(attempt, None)
+                if delay is None:
+                    raise RequestFailed(f"{self.host}: {e!r}", retries=attempt) from e
+            else:
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    return response, attempt
+            await asyncio.sleep(delay)
+
+    def report(self):
+        return (
+            f"{self.limiter.report()}; {self.retries} retries, "
+            f"circuit breaker tripped {self.breaker.trips} times"
+        )
+
+    def _check_breaker(self, attempt):
+        if (remaining := self.breaker.open_for()) > 0:
+            raise CircuitOpen(
+                f"{self.host} keeps failing; holding off for {remaining:.0f}s",
+                retries=attempt,
+            )
+
+    def _retry_delay(self, attempt, response):
+        # how long to wait before retrying, or None if we shouldn't
+        if response is not None and not is_transient(response):
+            self.breaker.record_success()
+            return None
+
+        if response is None or response.status_code != 429:
+            # being told to slow down doesn't mean the host is down
+            self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            return None
+
+        self.retries += 1
+        if response is not None and (retry_after := retry_after_seconds(response)) is not None:
+            # everyone else talking to this host should hold off too;
+            # the limiter will make us wait
+            self.limiter.pause(retry_after)
+            return 0.0
+        return backoff_seconds(attempt, self.backoff_base)
+
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+def throttle_for_host(host):
+    "The shared HostThrottle for `host`, so all our traffic to it is paced together"
+    with _throttles_lock:
+        if host not in _throttles:
+            limits = HOST_LIMITS.get(host, DEFAULT_HOST_LIMITS)
+            _throttles[host] = HostThrottle(host, limits['rate'], limits['burst'])
+        return _throttles[host]
@@ -0,0 +1,48 @@
+"""
+Worker processes for the CPU-bound parts of our commands, like parsing
+card data and checking deck legality.
+
+Workers are spawned fresh, so Django has to be set up before anything
+imports the models. Functions run on a worker should keep their model
+imports inside the function.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+
+def _init_worker(setup):
+    django.setup()
+    if setup is not None:
+        setup()
+
+
+def run_chunks(func, chunks, workers=DEFAULT_WORKERS, setup=None):
+    """Call `func` on each of `chunks` in a pool of `workers` processes,
+    yielding the results in order.
+
+    Only a couple of chunks per worker are in flight at a time, so a
+    slow consumer makes the reader wait instead of piling up memory.
+    `setup`, if given, runs once in each worker after Django is set up.
+    `func` and `setup` have to be module-level functions, so they can be
+    sent to the workers."""
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(setup,),
+    ) as pool:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.submit(func, chunk))
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from . import models
+from .legality import recheck_decks_containing
 
 
 admin.site.site_header = 'SmallFormats admin'
@@ -21,6 +22,10 @@ class CardAdmin(admin.ModelAdmin):
         'editorial_printing',
     ]
 
+    def save_model(self, request, obj, form, change):
+        obj.set_default_printing()
+        super().save_model(request, obj, form, change)
+
 
 class PrintingAdmin(admin.ModelAdmin):
     model = models.Printing
@@ -45,6 +50,38 @@ class CardInDeckAdmin(admin.ModelAdmin):
     ]
 
 
+class BannedCardAdmin(admin.ModelAdmin):
+    list_display = ('card', 'applies_as_commander_only', 'note')
+    autocomplete_fields = ('card',)
+    search_fields = [
+        'card__name',
+    ]
+
+    # a ban list change can only affect decks with the card in them,
+    # so recheck those rather than waiting on a full recheck
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change or 'applies_as_commander_only' in form.changed_data:
+            self._recheck(request, [obj.card_id])
+
+    def delete_model(self, request, obj):
+        card_id = obj.card_id
+        super().delete_model(request, obj)
+        self._recheck(request, [card_id])
+
+    def delete_queryset(self, request, queryset):
+        card_ids = list(queryset.values_list('card_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self._recheck(request, card_ids)
+
+    def _recheck(self, request, card_ids):
+        checked, changed = recheck_decks_containing(card_ids)
+        self.message_user(
+            request,
+            f"Rechecked {checked} decks; {changed} changed legality",
+        )
+
+
 class CommanderAdmin(admin.ModelAdmin):
     list_display = ('commander1', 'commander2')
     list_display_links = ('commander1', 'commander2')
@@ -72,6 +109,7 @@ admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Deck, DeckAdmin)
 admin.site.register(models.Card, CardAdmin)
 admin.site.register(models.CardInDeck, CardInDeckAdmin)
+admin.site.register(models.BannedCard, BannedCardAdmin)
 admin.site.register(models.Printing, PrintingAdmin)
 admin.site.register(models.SiteStat)
 admin.site.register(models.Commander, CommanderAdmin)
@@ -0,0 +1,228 @@
+import functools
+import operator
+import time
+from collections import defaultdict, namedtuple
+
+from decklist.models import Card, CardInDeck, Deck, PartnerType
+from decklist.models.identity import ALL_COLORS
+
+
+CHUNK_SIZE = 2000
+
+# everything the legality rules need to know about a card
+CardFacts = namedtuple(
+    'CardFacts',
+    (
+        'name', 'identity', 'common', 'uncommon', 'creature', 'partner_type',
+        # banned anywhere in a deck, and banned in the command zone
+        'banned', 'banned_as_commander',
+    ),
+)
+
+_PARTNER_WITH_TYPES = frozenset((
+    PartnerType.PARTNER_WITH_BLARING,
+    PartnerType.PARTNER_WITH_CHAKRAM,
+    PartnerType.PARTNER_WITH_PROTEGE,
+    PartnerType.PARTNER_WITH_SOULBLADE,
+    PartnerType.PARTNER_WITH_WEAVER,
+))
+_BACKGROUND_PAIR = frozenset((
+    PartnerType.CHOOSE_A_BACKGROUND,
+    PartnerType.BACKGROUND,
+))
+
+
+class LegalityChecker:
+    """Checks decks for PDH legality from their card lists alone.
+
+    Loads the few facts the rules care about for every card once, so
+    checking a deck takes no queries. Gives the same answers as
+    `Deck.check_deck_legality()`."""
+
+    _FIELDS = (
+        'id', 'name', 'identity',
+        'has_common_printing', 'has_uncommon_printing',
+        'type_line', 'partner_type', 'ban__applies_as_commander_only',
+    )
+
+    def __init__(self):
+        self._cards = {}
+        self._load(Card.objects.all())
+
+    def _load(self, cards):
+        rows = cards.values_list(*self._FIELDS).iterator(chunk_size=5000)
+        for (
+            card_id, name, identity, common, uncommon, type_line, partner_type,
+            commander_only_ban,
+        ) in rows:
+            self._cards[card_id] = CardFacts(
+                name=name,
+                identity=identity,
+                common=common,
+                uncommon=uncommon,
+                creature='Creature' in type_line,
+                partner_type=partner_type,
+                # null unless the card is banned
+                banned=commander_only_ban is False,
+                banned_as_commander=commander_only_ban is not None,
+            )
+
+    def __len__(self):
+        return len(self._cards)
+
+    def facts(self, card_id):
+        if card_id not in self._cards:
+            # a card added since we loaded
+            self._load(Card.objects.filter(id=card_id))
+        return self._cards[card_id]
+
+    def check(self, cards):
+        """Whether a deck is legal, and if not, why. `cards` are the
+        deck's (card ID, is commander) pairs."""
+        cards = [(self.facts(card_id), card_id, is_commander) for card_id, is_commander in cards]
+
+        # deck has cards at all
+        # (TODO: someday, we'll check for 100 cards)
+        if not cards:
+            return False, "no cards in deck"
+
+        if any(
+            facts.banned or (is_commander and facts.banned_as_commander)
+            for facts, _, is_commander in cards
+        ):
+            return False, "contains banned card"
+
+        # deck has a plausible number of commanders, all commanders printed at
+        # uncommon, each have correct types, and partnership is legal
+        commanders = sorted(
+            ((facts, card_id) for facts, card_id, is_commander in cards if is_commander),
+            # same order as a Commander's cards
+            key=operator.itemgetter(1),
+        )
+        match commanders:
+            case ((commander1, _),):
+                if not commander1.uncommon:
+                    return False, f"commander {commander1.name} not printed at uncommon"
+                if not commander1.creature:
+                    return False, f"commander {commander1.name} is not a creature"
+
+            case ((commander1, card_id1), (commander2, card_id2)):
+                for commander in (commander1, commander2):
+                    if not commander.uncommon:
+                        return False, f"commander {commander.name} not printed at uncommon"
+                if not (commander1.creature or commander2.creature):
+                    return False, "at least one commander must be a creature"
+
+                partner_types = (commander1.partner_type, commander2.partner_type)
+                if partner_types == (PartnerType.PARTNER, PartnerType.PARTNER):
+                    # both are standard partners
+                    pass
+                elif frozenset(partner_types) == _BACKGROUND_PAIR:
+                    # background and choose-a-background
+                    pass
+                elif partner_types[0] == partner_types[1] and partner_types[0] in _PARTNER_WITH_TYPES:
+                    # compatible partnerships, as long as they're different
+                    if card_id1 == card_id2:
+                        return False, f'invalid partnership: two copies of "{commander1.name}"'
+                else:
+                    return False, f'invalid partnership: "{commander1.name}" and "{commander2.name}"'
+
+            case ():
+                return False, "no commander"
+
+            case _:
+                return False, f"{len(commanders)} is too many commanders"
+
+        # all cards in correct identity
+        identity = functools.reduce(operator.or_, (facts.identity for facts, _ in commanders))
+        if identity != ALL_COLORS:
+            illegal_card_count = sum(1 for facts, _, _ in cards if facts.identity & ~identity)
+            if illegal_card_count > 0:
+                return False, f"{illegal_card_count} cards out of color identity"
+
+        # all other cards printed at common
+        if any(not facts.common for facts, _, is_commander in cards if not is_commander):
+            return False, "non-commander not printed at common"
+
+        return True, None
+
+    def identity(self, cards):
+        "Combined color identity of the commanders among a deck's (card ID, is commander) pairs"
+        return functools.reduce(
+            operator.or_,
+            (self.facts(card_id).identity for card_id, is_commander in cards if is_commander),
+            0,
+        )
+
+    def check_deck(self, deck):
+        "Same as `check()`, for a saved deck"
+        return self.check(deck.card_list.values_list('card_id', 'is_pdh_commander'))
+
+
+def read_deck_chunks(decks, chunk_size=CHUNK_SIZE):
+    """Yield the decks in the `decks` queryset as lists of (deck ID, name,
+    currently legal, card list) records, where each card list is
+    (card ID, is commander) pairs."""
+    # walk the decks in ID order so each chunk is a cheap range scan
+    last_id = 0
+    while True:
+        rows = list(
+            decks
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'name', 'pdh_legal')
+            [:chunk_size]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        cards = defaultdict(list)
+        card_lists = (
+            CardInDeck.objects
+            .filter(deck_id__in=[deck_id for deck_id, _, _ in rows])
+            .values_list('deck_id', 'card_id', 'is_pdh_commander')
+        )
+        for deck_id, card_id, is_commander in card_lists:
+            cards[deck_id].append((card_id, is_commander))
+
+        yield [
+            (deck_id, name, pdh_legal, cards[deck_id])
+            for deck_id, name, pdh_legal in rows
+        ]
+
+
+def check_chunk(decks, checker):
+    """Check a chunk from `read_deck_chunks()`.
+
+    Returns (decks checked, changes, seconds spent checking), where
+    changes are (deck ID, name, is legal, reason) for decks whose
+    legality changed."""
+    start = time.perf_counter()
+    changes = []
+    for deck_id, name, pdh_legal, cards in decks:
+        is_legal, reason = checker.check(cards)
+        if is_legal != pdh_legal:
+            changes.append((deck_id, name, is_legal, reason))
+    return len(decks), changes, time.perf_counter() - start
+
+
+def save_changes(changes):
+    "Write back the changes from `check_chunk()`"
+    Deck.objects.bulk_update(
+        [Deck(id=deck_id, pdh_legal=is_legal) for deck_id, _, is_legal, _ in changes],
+        ['pdh_legal'],
+    )
+
+
+def recheck_decks_containing(card_ids, checker=None):
+    """Recheck, on this thread, every deck with any of `card_ids` in it,
+    e.g. after a ban list change. Returns (decks checked, decks changed)."""
+    checker = checker or LegalityChecker()
+    checked = changed = 0
+    for chunk in read_deck_chunks(Deck.objects.containing(card_ids)):
+        size, changes, _ = check_chunk(chunk, checker)
+        save_changes(changes)
+        checked += size
+        changed += len(changes)
+    return checked, changed
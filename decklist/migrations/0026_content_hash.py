@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0025_alter_theme_filter_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='printing',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
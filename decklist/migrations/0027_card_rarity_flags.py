@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:12
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def populate_rarity_flags(apps, schema_editor):
+    Card = apps.get_model('decklist', 'Card')
+    Printing = apps.get_model('decklist', 'Printing')
+    Card.objects.update(
+        has_common_printing=Exists(
+            Printing.objects.filter(card=OuterRef('pk'), rarity='C')
+        ),
+        has_uncommon_printing=Exists(
+            Printing.objects.filter(card=OuterRef('pk'), rarity='U')
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0026_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='has_common_printing',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='has_uncommon_printing',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(populate_rarity_flags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_default_printings(apps, schema_editor):
+    Card = apps.get_model('decklist', 'Card')
+    Printing = apps.get_model('decklist', 'Printing')
+    Card.objects.update(default_printing=Coalesce(
+        'editorial_printing',
+        Subquery(
+            Printing.objects
+            .filter(card=OuterRef('pk'))
+            .exclude(image_uri='')
+            .order_by('-is_highres', '-is_paper', '-release_date')
+            .values('id')[:1]
+        ),
+    ))
+    Card.objects.update(image_uri=Coalesce(
+        Subquery(
+            Printing.objects
+            .filter(pk=OuterRef('default_printing'))
+            .values('image_uri')[:1]
+        ),
+        Value(''),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0027_card_rarity_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='default_printing',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='default_showings', to='decklist.printing'),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='image_uri',
+            field=models.URLField(blank=True, editable=False),
+        ),
+        migrations.RunPython(populate_default_printings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0028_card_default_printing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deck',
+            name='card_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='deck',
+            name='cards_updated_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
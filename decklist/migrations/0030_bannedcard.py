@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# same as decklist.models.bannedcard.INITIAL_BAN_LIST, as of this migration;
+# what used to be hard-coded in Deck.check_deck_legality()
+INITIAL_BAN_LIST = (
+    # (name, applies as commander only, note)
+    ('Mystic Remora', False, 'PDH ban list'),
+    ('Rhystic Study', False, 'PDH ban list'),
+    ('Dryad Arbor', True, 'not a legal commander'),
+    ('Pradesh Gypsies', False, 'WotC inclusiveness ban'),
+    ('Stone-Throwing Devils', False, 'WotC inclusiveness ban'),
+)
+
+
+def seed_ban_list(apps, schema_editor):
+    Card = apps.get_model('decklist', 'Card')
+    BannedCard = apps.get_model('decklist', 'BannedCard')
+    for name, commander_only, note in INITIAL_BAN_LIST:
+        # a fresh database may not have the cards yet;
+        # fetch-cards bans them once they arrive
+        for card in Card.objects.filter(name=name):
+            BannedCard.objects.get_or_create(
+                card=card,
+                defaults={
+                    'applies_as_commander_only': commander_only,
+                    'note': note,
+                },
+            )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0029_deck_card_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BannedCard',
+            fields=[
+                ('card', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ban', serialize=False, to='decklist.card')),
+                ('applies_as_commander_only', models.BooleanField(default=False)),
+                ('note', models.CharField(blank=True, max_length=100)),
+            ],
+        ),
+        migrations.RunPython(seed_ban_list, migrations.RunPython.noop),
+    ]
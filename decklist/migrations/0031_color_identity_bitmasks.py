@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:34
+
+import django.db.models.expressions
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_commander_identities(apps, schema_editor):
+    Card = apps.get_model('decklist', 'Card')
+    Commander = apps.get_model('decklist', 'Commander')
+
+    def card_identity(slot):
+        return Subquery(Card.objects.filter(pk=OuterRef(slot)).values('identity')[:1])
+
+    Commander.objects.update(
+        identity=card_identity('commander1').bitor(
+            Coalesce(card_identity('commander2'), Value(0))
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0030_bannedcard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='identity',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.Case(models.When(identity_w=True, then=models.Value(1)), default=models.Value(0)), '+', models.Case(models.When(identity_u=True, then=models.Value(2)), default=models.Value(0))), '+', models.Case(models.When(identity_b=True, then=models.Value(4)), default=models.Value(0))), '+', models.Case(models.When(identity_r=True, then=models.Value(8)), default=models.Value(0))), '+', models.Case(models.When(identity_g=True, then=models.Value(16)), default=models.Value(0))), output_field=models.PositiveSmallIntegerField()),
+        ),
+        migrations.AddField(
+            model_name='commander',
+            name='identity',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(populate_commander_identities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:35
+
+from django.contrib.postgres.aggregates import BitOr
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_deck_summaries(apps, schema_editor):
+    Deck = apps.get_model('decklist', 'Deck')
+    CardInDeck = apps.get_model('decklist', 'CardInDeck')
+
+    cards = CardInDeck.objects.filter(deck=OuterRef('pk')).values('deck')
+    Deck.objects.update(
+        card_count=Coalesce(
+            Subquery(cards.annotate(n=Count('id')).values('n')),
+            Value(0),
+        ),
+        identity=Coalesce(
+            Subquery(
+                cards
+                .filter(is_pdh_commander=True)
+                .annotate(bits=BitOr('card__identity'))
+                .values('bits')
+            ),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0031_color_identity_bitmasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deck',
+            name='card_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='deck',
+            name='identity',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(populate_deck_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0032_deck_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commander',
+            name='themes_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
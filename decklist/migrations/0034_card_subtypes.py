@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:42
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def populate_subtypes(apps, schema_editor):
+    Card = apps.get_model('decklist', 'Card')
+
+    # same as crawler.card_parsing.parse_subtypes, as of this migration
+    def parse_subtypes(type_line):
+        subtypes = []
+        for face in type_line.split(' // '):
+            _, _, after_dash = face.partition('—')
+            for subtype in after_dash.split():
+                if subtype not in subtypes:
+                    subtypes.append(subtype)
+        return subtypes
+
+    cards = []
+    for card in Card.objects.only('id', 'type_line').iterator(chunk_size=5000):
+        card.subtypes = parse_subtypes(card.type_line)
+        if card.subtypes:
+            cards.append(card)
+    Card.objects.bulk_update(cards, ['subtypes'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decklist', '0033_commander_themes_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='subtypes',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=50), blank=True, default=list, size=None),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['subtypes'], name='card_subtypes_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['keywords'], name='card_keywords_gin'),
+        ),
+        migrations.RunPython(populate_subtypes, migrations.RunPython.noop),
+    ]
@@ -11,6 +11,7 @@ from .deck import Deck
 from .card import Card, TopCardView, TopLandCardView, TopNonLandCardView
 from .printing import Printing
 from .cardindeck import CardInDeck
+from .bannedcard import BannedCard
 from .sitestat import SiteStat
 from .commander import Commander
 from .theme import Theme
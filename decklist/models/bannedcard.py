@@ -0,0 +1,62 @@
+from django.db import models
+from .card import Card
+
+
+# bans which are always in force, by card name; fetch-cards makes sure
+# each of these is on the ban list once the card exists
+INITIAL_BAN_LIST = (
+    # (name, applies as commander only, note)
+    ('Mystic Remora', False, 'PDH ban list'),
+    ('Rhystic Study', False, 'PDH ban list'),
+    ('Dryad Arbor', True, 'not a legal commander'),
+    ('Pradesh Gypsies', False, 'WotC inclusiveness ban'),
+    ('Stone-Throwing Devils', False, 'WotC inclusiveness ban'),
+)
+
+
+class BannedCardQuerySet(models.QuerySet):
+    def seed_initial(self):
+        """Ban any card on `INITIAL_BAN_LIST` which isn't banned yet,
+        leaving existing bans alone. Returns the IDs of the cards which
+        were newly banned."""
+        notes = {
+            name: (commander_only, note)
+            for name, commander_only, note in INITIAL_BAN_LIST
+        }
+        cards = (
+            Card.objects
+            .filter(name__in=notes, ban__isnull=True)
+            .values_list('id', 'name')
+        )
+        created = self.bulk_create(
+            [
+                self.model(
+                    card_id=card_id,
+                    applies_as_commander_only=notes[name][0],
+                    note=notes[name][1],
+                )
+                for card_id, name in cards
+            ],
+            ignore_conflicts=True,
+        )
+        return [ban.card_id for ban in created]
+
+
+class BannedCard(models.Model):
+    card = models.OneToOneField(
+        Card,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ban',
+    )
+    # e.g. Dryad Arbor, which may not be a commander
+    # but isn't otherwise banned
+    applies_as_commander_only = models.BooleanField(default=False)
+    note = models.CharField(max_length=100, blank=True)
+
+    objects = BannedCardQuerySet.as_manager()
+
+    def __str__(self):
+        if self.applies_as_commander_only:
+            return f"{self.card} (as commander)"
+        return str(self.card)
@@ -1,14 +1,34 @@
 from django.db import models
-from django.db.models import Count, F, Q, Window
-from django.db.models.functions import Rank
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Value, Window
+from django.db.models.functions import Coalesce, Rank
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVector
 from .partnertype import PartnerType
 from .rarity import Rarity
+from .identity import identity_bits, identity_expression
 
 import logging
 logger = logging.getLogger('decklist.models.card')
 
 
+def _best_printings(printings):
+    return (
+        printings
+        # the default printing is mostly used for image-related things,
+        # so let's try to find a printing with a picture
+        .exclude(image_uri='')
+        .order_by(
+            # https://code.djangoproject.com/ticket/19726#comment:8
+            # False orders first, and we want True for both of these
+            '-is_highres',
+            '-is_paper',
+            # let's get the newest printing
+            '-release_date',
+        )
+    )
+
+
 class CardQuerySet(models.QuerySet):
     def top_lands(self):
         logger.warn("Called slow path: CardQuerySet::top_lands (use TopLandCardView instead)")
@@ -35,11 +55,7 @@ class CardQuerySet(models.QuerySet):
             self
             .filter(
                 type_line__contains='Land',
-                identity_w=w,
-                identity_u=u,
-                identity_b=b,
-                identity_r=r,
-                identity_g=g,
+                identity=identity_bits(w, u, b, r, g),
             )
             ._count_and_rank_decks()
         )
@@ -47,13 +63,7 @@ class CardQuerySet(models.QuerySet):
     def ranked_cards_of_color(self, w: bool, u: bool, b: bool, r: bool, g: bool):
         return (
             self
-            .filter(
-                identity_w=w,
-                identity_u=u,
-                identity_b=b,
-                identity_r=r,
-                identity_g=g,
-            )
+            .filter(identity=identity_bits(w, u, b, r, g))
             ._count_and_rank_decks()
         )
 
@@ -72,6 +82,77 @@ class CardQuerySet(models.QuerySet):
             ))
         )
     
+    def refresh_rarity_flags(self):
+        """Recompute the denormalized rarity flags from printings, only
+        touching cards whose flags changed. Returns the number of cards
+        updated."""
+        from .printing import Printing
+
+        updated = 0
+        for field, rarity in (
+            ('has_common_printing', Rarity.COMMON),
+            ('has_uncommon_printing', Rarity.UNCOMMON),
+        ):
+            printed_at_rarity = Exists(
+                Printing.objects.filter(card=OuterRef('pk'), rarity=rarity)
+            )
+            updated += (
+                self
+                .filter(**{field: False})
+                .filter(printed_at_rarity)
+                .update(**{field: True})
+            )
+            updated += (
+                self
+                .filter(**{field: True})
+                .exclude(printed_at_rarity)
+                .update(**{field: False})
+            )
+        return updated
+
+    def refresh_default_printings(self):
+        """Re-pick each card's default printing and copy its image URI,
+        only touching cards where either changed. Returns the number of
+        cards updated."""
+        from .printing import Printing
+
+        chosen_printing = Coalesce(
+            'editorial_printing',
+            Subquery(
+                _best_printings(Printing.objects.filter(card=OuterRef('pk')))
+                .values('id')[:1]
+            ),
+        )
+        updated = (
+            self
+            .alias(chosen_printing=chosen_printing)
+            # default_printing IS DISTINCT FROM chosen_printing; a plain
+            # exclude() gets cards with no printings wrong either way
+            .filter(
+                Q(default_printing__isnull=True, chosen_printing__isnull=False)
+                | Q(default_printing__isnull=False, chosen_printing__isnull=True)
+                | Q(default_printing__lt=F('chosen_printing'))
+                | Q(default_printing__gt=F('chosen_printing'))
+            )
+            .update(default_printing=chosen_printing)
+        )
+
+        chosen_image = Coalesce(
+            Subquery(
+                Printing.objects
+                .filter(pk=OuterRef('default_printing'))
+                .values('image_uri')[:1]
+            ),
+            Value(''),
+        )
+        updated += (
+            self
+            .alias(chosen_image=chosen_image)
+            .exclude(image_uri=F('chosen_image'))
+            .update(image_uri=chosen_image)
+        )
+        return updated
+
     def search(self, query):
         return (
             self
@@ -118,8 +199,18 @@ class Card(models.Model):
     identity_b = models.BooleanField(default=False, verbose_name='is B')
     identity_r = models.BooleanField(default=False, verbose_name='is R')
     identity_g = models.BooleanField(default=False, verbose_name='is G')
+    # the above as a bitmask, for indexed color lookups
+    identity = models.GeneratedField(
+        expression=identity_expression(),
+        output_field=models.PositiveSmallIntegerField(),
+        db_persist=True,
+        db_index=True,
+    )
     # double-sided cards have double-sided type_lines
     type_line = models.CharField(max_length=100)
+    # parsed from type_line by the card-data importer, so typal
+    # lookups can use an index instead of substring matching
+    subtypes = ArrayField(models.CharField(max_length=50), default=list, blank=True)
     keywords = models.JSONField(default=list)
     scryfall_uri = models.URLField(max_length=300)
     editorial_printing = models.ForeignKey(
@@ -133,6 +224,29 @@ class Card(models.Model):
         choices=PartnerType.choices,
         default=PartnerType.NONE,
     )
+    # the editorial printing if there is one, otherwise our best pick;
+    # kept up to date by the card-data importer and `set_default_printing`
+    default_printing = models.ForeignKey(
+        'Printing',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='default_showings',
+        editable=False,
+    )
+    image_uri = models.URLField(max_length=200, blank=True, editable=False)
+    # denormalized from printings by the card-data importer
+    has_common_printing = models.BooleanField(default=False, db_index=True)
+    has_uncommon_printing = models.BooleanField(default=False, db_index=True)
+    # hash of the ingested fields, so the card-data importer can
+    # skip rewriting cards which haven't changed upstream
+    content_hash = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        indexes = (
+            GinIndex(fields=('subtypes',), name='card_subtypes_gin'),
+            GinIndex(fields=('keywords',), name='card_keywords_gin'),
+        )
 
     def __str__(self):
         return self.name
@@ -144,36 +258,19 @@ class Card(models.Model):
     
     @property
     def ever_common(self):
-        return self.printings.filter(
-            rarity=Rarity.COMMON
-        ).count() > 0
+        return self.has_common_printing
     
     @property
     def ever_uncommon(self):
-        return self.printings.filter(
-            rarity=Rarity.UNCOMMON
-        ).count() > 0
+        return self.has_uncommon_printing
     
-    @property
-    def default_printing(self):
-        if self.editorial_printing:
-            return self.editorial_printing
-        
-        return (
-            self.printings
-            # this property is mostly used for image-related things,
-            # so let's try to find a printing with a picture
-            .exclude(image_uri='')
-            .order_by(
-                # https://code.djangoproject.com/ticket/19726#comment:8
-                # False orders first, and we want True for both of these
-                '-is_highres',
-                '-is_paper',
-                # let's get the newest printing
-                '-release_date',
-            )
-            .first()
+    def set_default_printing(self):
+        "Re-pick the default printing; doesn't save"
+        self.default_printing = (
+            self.editorial_printing
+            or _best_printings(self.printings.all()).first()
         )
+        self.image_uri = self.default_printing.image_uri if self.default_printing else ''
 
     @property
     def in_deck_count(self):
@@ -212,3 +309,4 @@ class CardView(models.Model):
 class TopCardView(CardView): pass
 class TopLandCardView(CardView): pass
 class TopNonLandCardView(CardView): pass
+
@@ -1,14 +1,17 @@
 import uuid
-import functools
-import operator
 from django.db import models
-from django.db.models import Q, F, Count, Window, Subquery, OuterRef
-from django.db.models.functions import Rank
+from django.db.models import Q, F, Count, Value, Window, Subquery, OuterRef
+from django.db.models.functions import Coalesce, Rank
 from .card import Card
 from .partnertype import PartnerType
+from .identity import identity_bits
 from .synergyscore import SynergyScore
 
 
+def _card_identity(slot):
+    return Subquery(Card.objects.filter(pk=OuterRef(slot)).values('identity')[:1])
+
+
 class CommanderQuerySet(models.QuerySet):
     def legal_decks(self):
         return self.filter(decks__pdh_legal=True)
@@ -56,64 +59,89 @@ class CommanderQuerySet(models.QuerySet):
         )
 
     def decks_of_exact_color(self, w, u, b, r, g):
-        wubrg = {
-            'w': w,
-            'u': u,
-            'b': b,
-            'r': r,
-            'g': g,
-        }
-        filters = []
-        # for each color...
-        for c in 'wubrg':
-            cmdr1 = f'commander1__identity_{c}'
-            cmdr2 = f'commander2__identity_{c}'
-            # ... if we want the color, either partner can bring it
-            if wubrg[c]:
-                filters.append(Q(**dict([(cmdr1,True),])) | Q(**dict([(cmdr2,True),])))
-            # ... if we don't want the color, neither partner can bring it
-            # ... or else partner2 can be empty
-            else:
-                filters.append(
-                    Q(**dict([(cmdr1,False),])) & 
-                    (Q(commander2__isnull=True) | Q(**dict([(cmdr2,False),])))
-                )
-        
         return (
             self
             .legal_decks()
-            .filter(*filters)
+            .filter(identity=identity_bits(w, u, b, r, g))
         )
 
     def decks_of_at_least_color(self, w, u, b, r, g):
         # for colorless, it's all legal decks
-        if not any([w, u, b, r, g]):
+        wanted = identity_bits(w, u, b, r, g)
+        if not wanted:
             return self.legal_decks()
 
-        # build up a filter for the aggregation
-        # that has a Q object set to True for each color we
-        # care about and nothing for the colors which we don't
-        wubrg = {
-            'w': w,
-            'u': u,
-            'b': b,
-            'r': r,
-            'g': g,
-        }
-        filters = []
-        for c in 'wubrg':
-            if wubrg[c]:
-                cmdr1 = f'commander1__identity_{c}'
-                cmdr2 = f'commander2__identity_{c}'
-                filters.append(Q(**dict([(cmdr1,True),])) | Q(**dict([(cmdr2,True),])))
-        filters = functools.reduce(operator.and_, filters)
-
         return (
             self
             .legal_decks()
-            .filter(filters)
+            .alias(wanted_colors=F('identity').bitand(wanted))
+            .filter(wanted_colors=wanted)
         )
-    
+
+    def for_cards(self, card_ids):
+        "The Commander for one or two commander card IDs, created if need be"
+        commander1_id, commander2_id = (sorted(card_ids) + [None])[:2]
+        cmdr, _ = self.get_or_create(
+            commander1_id=commander1_id,
+            commander2_id=commander2_id,
+        )
+        return cmdr
+
+    def create_for_pairs(self, pairs):
+        """Bulk-create Commanders for (commander1 ID, commander2 ID) pairs,
+        with commander2 None for a solo commander, skipping any which
+        already exist. Returns ({pair: Commander ID} for all of them,
+        how many were created)."""
+        pairs = set(pairs)
+        card_ids = {card_id for pair in pairs for card_id in pair if card_id}
+        identities = dict(
+            Card.objects
+            .filter(id__in=card_ids)
+            .values_list('id', 'identity')
+        )
+
+        commanders = []
+        for commander1_id, commander2_id in pairs:
+            cmdr = Commander(
+                commander1_id=commander1_id,
+                commander2_id=commander2_id,
+                identity=identities[commander1_id] | identities.get(commander2_id, 0),
+            )
+            cmdr.sfid = cmdr._compute_sfid()
+            commanders.append(cmdr)
+        sfids = [cmdr.sfid for cmdr in commanders]
+        existing = set(self.filter(sfid__in=sfids).values_list('sfid', flat=True))
+        # someone else may have created some of these since we looked
+        self.bulk_create(
+            [cmdr for cmdr in commanders if cmdr.sfid not in existing],
+            ignore_conflicts=True,
+        )
+
+        ids_by_sfid = dict(
+            self
+            .filter(sfid__in=sfids)
+            .values_list('sfid', 'id')
+        )
+        return {
+            (cmdr.commander1_id, cmdr.commander2_id): ids_by_sfid[cmdr.sfid]
+            for cmdr in commanders
+        }, len(commanders) - len(existing)
+
+    def refresh_identities(self):
+        """Recompute each commander's identity from its cards, only
+        touching commanders where it changed. Returns the number of
+        commanders updated."""
+        identity = (
+            _card_identity('commander1')
+            .bitor(Coalesce(_card_identity('commander2'), Value(0)))
+        )
+        return (
+            self
+            .alias(cards_identity=identity)
+            .exclude(identity=F('cards_identity'))
+            .update(identity=identity)
+        )
+
     def count_and_rank_decks(self):
         return (
             self
@@ -184,6 +212,10 @@ class Commander(models.Model):
     )
     # sfid = SmallFormats identifier
     sfid = models.UUIDField(unique=True, verbose_name='SmallFormats ID')
+    # both cards' identities combined; see `.identity`
+    identity = models.PositiveSmallIntegerField(default=0, db_index=True, editable=False)
+    # what its theme results were last computed from; see compute-themes
+    themes_fingerprint = models.CharField(max_length=32, blank=True, editable=False)
 
     class Meta:
         constraints = [
@@ -220,6 +252,7 @@ class Commander(models.Model):
     def save(self, *args, **kwargs):
         if not self.sfid:
             self.sfid = self._compute_sfid()
+        self.identity = self._compute_identity()
         super().save(*args, **kwargs)
 
     def clean(self):
@@ -229,9 +262,15 @@ class Commander(models.Model):
         # compute the SFID
         self.sfid = self._compute_sfid()
 
+    def _compute_identity(self):
+        identity = self.commander1.identity
+        if self.commander2:
+            identity |= self.commander2.identity
+        return identity
+
     def _compute_sfid(self):
-        namespace = self.commander1.id
-        name = str(self.commander2.id) if self.commander2 else ''
+        namespace = self.commander1_id
+        name = str(self.commander2_id) if self.commander2_id else ''
         return uuid.uuid5(namespace, name)
 
     @property
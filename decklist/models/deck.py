@@ -1,17 +1,34 @@
 import operator
 import functools
+import hashlib
 from django.db import models
-from django.db.models import Q, Count
+from django.db.models import F, Q
 from django.utils import timezone
 from .datasource import DataSource
 from .partnertype import PartnerType
-from .rarity import Rarity
+from .identity import ALL_COLORS
+
+
+def card_fingerprint(cards):
+    """Hash of a decklist's (card ID, is commander) pairs, in any order.
+    Two lists with the same fingerprint have the same cards."""
+    digest = hashlib.blake2b(digest_size=16)
+    for card_id, is_commander in sorted(cards):
+        digest.update(f'{card_id}:{int(is_commander)};'.encode())
+    return digest.hexdigest()
 
 
 class DeckQuerySet(models.QuerySet):
     def legal(self):
         return self.filter(pdh_legal=True)
 
+    def containing(self, cards):
+        "Decks with any of `cards` in them"
+        from .cardindeck import CardInDeck
+        return self.filter(
+            id__in=CardInDeck.objects.filter(card__in=cards).values('deck_id'),
+        )
+
 
 class Deck(models.Model):
     objects = DeckQuerySet.as_manager()
@@ -33,6 +50,12 @@ class Deck(models.Model):
         blank=True,
         related_name='decks',
     )
+    # blank until the deck's cards are next fetched
+    card_fingerprint = models.CharField(max_length=32, blank=True, editable=False)
+    cards_updated_time = models.DateTimeField(null=True, blank=True, editable=False)
+    # summarized from the card list by get-decklists
+    identity = models.PositiveSmallIntegerField(default=0, db_index=True, editable=False)
+    card_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -48,74 +71,18 @@ class Deck(models.Model):
             models.Index(fields=('pdh_legal',)),
         )
 
-    def commander_cards(self):
-        return (
-            self.card_list
-            .filter(is_pdh_commander=True)
-            .select_related('card')
-        )
-    
-    def identity(self):
-        cmdr_identities = (
-            self.card_list
-            .filter(is_pdh_commander=True)
-            .select_related('card')
-            .aggregate(
-                white=models.Count('card', filter=Q(card__identity_w=True)),
-                blue= models.Count('card', filter=Q(card__identity_u=True)),
-                black=models.Count('card', filter=Q(card__identity_b=True)),
-                red=  models.Count('card', filter=Q(card__identity_r=True)),
-                green=models.Count('card', filter=Q(card__identity_g=True)),
-            )
+    def compute_card_fingerprint(self):
+        return card_fingerprint(
+            self.card_list.values_list('card_id', 'is_pdh_commander')
         )
 
-        return {
-            k: v > 0 for k, v in cmdr_identities.items()
-        }
-    
-    def identity_w(self):
-        return (
-            self.card_list
-            .select_related('card')
-            .filter(is_pdh_commander=True)
-            .filter(card__identity_w=True)
-            .count() > 0
-        )
-    
-    def identity_u(self):
-        return (
-            self.card_list
-            .select_related('card')
-            .filter(is_pdh_commander=True)
-            .filter(card__identity_u=True)
-            .count() > 0
-        )
-    
-    def identity_b(self):
-        return (
-            self.card_list
-            .select_related('card')
-            .filter(is_pdh_commander=True)
-            .filter(card__identity_b=True)
-            .count() > 0
-        )
-    
-    def identity_r(self):
+    def commander_cards(self):
         return (
             self.card_list
-            .select_related('card')
             .filter(is_pdh_commander=True)
-            .filter(card__identity_r=True)
-            .count() > 0
-        )
-    
-    def identity_g(self):
-        return (
-            self.card_list
             .select_related('card')
-            .filter(is_pdh_commander=True)
-            .filter(card__identity_g=True)
-            .count() > 0
+            # same order as a Commander's cards
+            .order_by('card_id')
         )
     
     def check_deck_legality(self):
@@ -128,15 +95,8 @@ class Deck(models.Model):
         if (
             self.card_list
             .filter(
-                # PDH ban list
-                Q(card__name='Mystic Remora')
-                | Q(card__name='Rhystic Study')
-                # not strictly banned, but not allowed as commander
-                # and never printed at common
-                | Q(card__name='Dryad Arbor')
-                # WotC inclusiveness bans ever printed at C or U
-                | Q(card__name='Pradesh Gypsies')
-                | Q(card__name='Stone-Throwing Devils')
+                Q(card__ban__applies_as_commander_only=False)
+                | Q(card__ban__applies_as_commander_only=True, is_pdh_commander=True)
             )
             .count()
         ) > 0:
@@ -144,7 +104,8 @@ class Deck(models.Model):
 
         # deck has a plausible number of commanders, all commanders printed at
         # uncommon, each have correct types, and partnership is legal
-        match list(self.commander_cards()):
+        commanders = list(self.commander_cards())
+        match commanders:
             case (commander1,):
                 if not commander1.card.ever_uncommon:
                     return False, f"commander {commander1.card.name} not printed at uncommon"
@@ -179,34 +140,18 @@ class Deck(models.Model):
                         return False, f'invalid partnership: "{commander1.card}" and "{commander2.card}"'
             
             case (commander1, commander2, *_):
-                return False, f"{len(self.commander_cards())} is too many commanders"
+                return False, f"{len(commanders)} is too many commanders"
             
             case _:
                 return False, "no commander"
 
         # all cards in correct identity
-        q_filters = []
-        identity = self.identity()
-
-        if all([val for _, val in identity.items()]):
-            # 5-color decks exclude no cards
-            pass
-        else:
-            if not identity['white']:
-                q_filters.append(Q(card__identity_w=True))
-            if not identity['blue']:
-                q_filters.append(Q(card__identity_u=True))
-            if not identity['black']:
-                q_filters.append(Q(card__identity_b=True))
-            if not identity['red']:
-                q_filters.append(Q(card__identity_r=True))
-            if not identity['green']:
-                q_filters.append(Q(card__identity_g=True))
-            filterset = functools.reduce(operator.or_, q_filters)
-
+        identity = functools.reduce(operator.or_, (c.card.identity for c in commanders))
+        if identity != ALL_COLORS:
             illegal_card_count = (
                 self.card_list
-                .filter(filterset)
+                .alias(off_colors=F('card__identity').bitand(ALL_COLORS & ~identity))
+                .filter(off_colors__gt=0)
                 .count()
             )
             if illegal_card_count > 0:
@@ -215,13 +160,10 @@ class Deck(models.Model):
         # all other cards printed at common
         noncommon_count = (
             self.card_list
-            .select_related('card')
-            .filter(is_pdh_commander=False)
-            .annotate(common_count=Count(
-                'card__printings',
-                filter=Q(card__printings__rarity=Rarity.COMMON)
-            ))
-            .filter(common_count=0)
+            .filter(
+                is_pdh_commander=False,
+                card__has_common_printing=False,
+            )
             .count()
         )
         if noncommon_count > 0:
@@ -0,0 +1,23 @@
+import functools
+import operator
+from django.db.models import Case, Value, When
+
+
+# color identity packed into a 5-bit mask, as stored in the
+# `identity` columns of Card, Commander, and Deck
+W, U, B, R, G = 1, 2, 4, 8, 16
+COLORLESS = 0
+ALL_COLORS = W | U | B | R | G
+
+
+def identity_bits(w, u, b, r, g):
+    "Mask for the given colors, e.g. `identity_bits(True, False, False, False, True)` is W|G"
+    return sum(bit for bit, is_color in zip((W, U, B, R, G), (w, u, b, r, g)) if is_color)
+
+
+def identity_expression(prefix=''):
+    "Database expression for the mask of the `identity_*` booleans under `prefix`"
+    return functools.reduce(operator.add, (
+        Case(When(**{f'{prefix}identity_{c}': True}, then=Value(bit)), default=Value(0))
+        for c, bit in zip('wubrg', (W, U, B, R, G))
+    ))
@@ -19,6 +19,8 @@ class Printing(models.Model):
     is_highres = models.BooleanField(default=True)
     is_paper = models.BooleanField(default=False)
     release_date = models.DateField(default=datetime.date(1993, 8, 5))
+    # see Card.content_hash
+    content_hash = models.CharField(max_length=32, blank=True)
 
     def __str__(self):
         return f"{self.card.name} ({self.set_code})"
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.db.models import F, Window
 from django.db.models.functions import Rank
 from .theme import Theme
@@ -15,6 +15,47 @@ class ThemeResultQuerySet(models.QuerySet):
             ))
         )
 
+    def sync(self, results):
+        """Make the results in this queryset match `results`, which maps
+        (theme ID, commander ID) to (theme deck count, total deck count),
+        writing only what changed. Returns (created, updated, deleted)."""
+        existing = {
+            (theme_id, commander_id): (result_id, counts)
+            for result_id, theme_id, commander_id, *counts in self.values_list(
+                'id', 'theme_id', 'commander_id', 'theme_deck_count', 'total_deck_count',
+            )
+        }
+
+        to_create = []
+        to_update = []
+        for (theme_id, commander_id), (theme_deck_count, total_deck_count) in results.items():
+            result_id, counts = existing.pop((theme_id, commander_id), (None, None))
+            if result_id is None:
+                to_create.append(ThemeResult(
+                    theme_id=theme_id,
+                    commander_id=commander_id,
+                    theme_deck_count=theme_deck_count,
+                    total_deck_count=total_deck_count,
+                ))
+            elif counts != [theme_deck_count, total_deck_count]:
+                to_update.append(ThemeResult(
+                    id=result_id,
+                    theme_deck_count=theme_deck_count,
+                    total_deck_count=total_deck_count,
+                ))
+        # whatever's left no longer has the theme
+        to_delete = [result_id for result_id, _ in existing.values()]
+
+        with transaction.atomic():
+            ThemeResult.objects.filter(id__in=to_delete).delete()
+            ThemeResult.objects.bulk_create(to_create, batch_size=1000)
+            ThemeResult.objects.bulk_update(
+                to_update,
+                ['theme_deck_count', 'total_deck_count'],
+                batch_size=1000,
+            )
+        return len(to_create), len(to_update), len(to_delete)
+
 
 class ThemeResult(models.Model):
     objects = ThemeResultQuerySet.as_manager()
@@ -2,7 +2,10 @@ from uuid import UUID, uuid4
 from warnings import filterwarnings
 from django.core.paginator import UnorderedObjectListWarning
 from django.test import TestCase, Client
-from .models import SynergyScore, Card, Commander, Deck, CardInDeck
+from .models import SynergyScore, Card, Commander, Deck, CardInDeck, PartnerType, BannedCard, User, Theme, ThemeResult
+from .legality import LegalityChecker
+from .themes import ThemeEngine
+from .tests_factories import make_card, make_deck
 import logging
 
 
@@ -156,3 +159,253 @@ class EnsureTopCardViewsMatchQueryTestCase(TestCase):
     def test_top_nonland_card_qs(self):
         # SELECT "decklist_card"."id", "decklist_card"."name", "decklist_card"."identity_w", "decklist_card"."identity_u", "decklist_card"."identity_b", "decklist_card"."identity_r", "decklist_card"."identity_g", "decklist_card"."type_line", "decklist_card"."keywords", "decklist_card"."scryfall_uri", "decklist_card"."editorial_printing_id", "decklist_card"."partner_type", COUNT(DISTINCT "decklist_cardindeck"."id") FILTER (WHERE "decklist_deck"."pdh_legal") AS "num_decks", RANK() OVER (ORDER BY COUNT(DISTINCT "decklist_cardindeck"."id") FILTER (WHERE "decklist_deck"."pdh_legal") DESC) AS "rank" FROM "decklist_card" LEFT OUTER JOIN "decklist_cardindeck" ON ("decklist_card"."id" = "decklist_cardindeck"."card_id") LEFT OUTER JOIN "decklist_deck" ON ("decklist_cardindeck"."deck_id" = "decklist_deck"."id") WHERE NOT ("decklist_card"."type_line"::text LIKE %Land%) GROUP BY "decklist_card"."id" HAVING COUNT(DISTINCT "decklist_cardindeck"."id") FILTER (WHERE ("decklist_deck"."pdh_legal")) > 0
         self._test_qs(Card.objects.top_nonlands)
+
+
+# The legality checker works from facts about cards loaded up front
+# rather than asking the database about each deck. It should agree
+# with Deck.check_deck_legality() on every deck.
+class LegalityCheckerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.cards = {
+            'tatyova': make_card('Tatyova', 'Legendary Creature', identity_u=True, identity_g=True),
+            'walker': make_card('Walker', 'Creature', has_common_printing=False),
+            'rare commander': make_card('Rare', 'Creature', has_common_printing=False, has_uncommon_printing=False, identity_g=True),
+            'sorcery commander': make_card('Sorcery', 'Sorcery', identity_g=True),
+            'partner w': make_card('Partner W', partner_type=PartnerType.PARTNER, identity_w=True),
+            'partner b': make_card('Partner B', partner_type=PartnerType.PARTNER, identity_b=True),
+            'ley weaver': make_card('Ley Weaver', partner_type=PartnerType.PARTNER_WITH_WEAVER, identity_u=True),
+            'lore weaver': make_card('Lore Weaver', partner_type=PartnerType.PARTNER_WITH_WEAVER, identity_u=True),
+            'chooser': make_card('Chooser', partner_type=PartnerType.CHOOSE_A_BACKGROUND, identity_r=True),
+            'background': make_card('Background', 'Legendary Enchantment — Background', partner_type=PartnerType.BACKGROUND, identity_w=True),
+            'rainbow': make_card('Rainbow', identity_w=True, identity_u=True, identity_b=True, identity_r=True, identity_g=True),
+            'forest': make_card('Forest', 'Basic Land — Forest', identity_g=True),
+            'island': make_card('Island', 'Basic Land — Island', identity_u=True),
+            'bolt': make_card('Bolt', 'Instant', identity_r=True),
+            'orb': make_card('Orb', 'Artifact'),
+            'rare': make_card('Rare Artifact', 'Artifact', has_common_printing=False),
+            'remora': make_card('Mystic Remora', 'Enchantment', identity_u=True),
+            'arbor': make_card('Dryad Arbor', 'Land Creature — Forest', identity_g=True),
+        }
+        BannedCard.objects.create(card=self.cards['remora'])
+        BannedCard.objects.create(card=self.cards['arbor'], applies_as_commander_only=True)
+        decks = {
+            'empty': [],
+            'legal': [('tatyova', True), ('forest', False), ('island', False), ('orb', False)],
+            'colorless legal': [('walker', True), ('orb', False)],
+            'five colors': [('rainbow', True), ('bolt', False), ('forest', False)],
+            'banned': [('tatyova', True), ('remora', False)],
+            'banned as commander': [('arbor', True), ('forest', False)],
+            'allowed in the 99': [('tatyova', True), ('arbor', False)],
+            'no commander': [('forest', False)],
+            'rare commander': [('rare commander', True), ('forest', False)],
+            'sorcery commander': [('sorcery commander', True)],
+            'partners': [('partner w', True), ('partner b', True), ('orb', False)],
+            'bad partners': [('partner w', True), ('tatyova', True)],
+            'partner with': [('ley weaver', True), ('lore weaver', True), ('island', False)],
+            'background': [('chooser', True), ('background', True), ('bolt', False)],
+            'two backgrounds': [('background', True), ('background', True)],
+            'too many': [('partner w', True), ('partner b', True), ('tatyova', True)],
+            'off color': [('walker', True), ('forest', False), ('island', False), ('bolt', False)],
+            'rare card': [('tatyova', True), ('rare', False)],
+        }
+        self.decks = {}
+        for name, contents in decks.items():
+            self.decks[name] = make_deck(
+                name,
+                commanders=[self.cards[c] for c, is_commander in contents if is_commander],
+                cards=[self.cards[c] for c, is_commander in contents if not is_commander],
+            )
+
+    def test_matches_deck_check(self):
+        checker = LegalityChecker()
+        for name, deck in self.decks.items():
+            with self.subTest(deck=name):
+                self.assertEqual(checker.check_deck(deck), deck.check_deck_legality())
+
+    def test_reasons(self):
+        checker = LegalityChecker()
+        expected = {
+            'empty': (False, "no cards in deck"),
+            'legal': (True, None),
+            'colorless legal': (True, None),
+            'five colors': (True, None),
+            'banned': (False, "contains banned card"),
+            'banned as commander': (False, "contains banned card"),
+            'allowed in the 99': (True, None),
+            'partners': (True, None),
+            'partner with': (True, None),
+            'background': (True, None),
+            'two backgrounds': (False, "at least one commander must be a creature"),
+            'too many': (False, "3 is too many commanders"),
+            'off color': (False, "3 cards out of color identity"),
+            'rare card': (False, "non-commander not printed at common"),
+        }
+        for name, result in expected.items():
+            with self.subTest(deck=name):
+                self.assertEqual(checker.check_deck(self.decks[name]), result)
+
+    def test_no_queries_per_deck(self):
+        checker = LegalityChecker()
+        cards = [(self.cards['tatyova'].id, True), (self.cards['forest'].id, False)]
+        with self.assertNumQueries(0):
+            self.assertEqual(checker.check(cards), (True, None))
+
+    def test_loads_new_cards(self):
+        checker = LegalityChecker()
+        card = make_card('Newcomer', has_common_printing=False)
+        self.assertEqual(checker.check([(card.id, True)]), (True, None))
+
+
+class BannedCardAdminTestCase(TestCase):
+    def setUp(self):
+        self.remora = make_card('Mystic Remora', 'Enchantment', identity_u=True)
+        commander = make_card('Commander', identity_u=True)
+        self.deck = make_deck('Deck', commanders=[commander], cards=[self.remora], pdh_legal=True)
+
+        self.client = Client()
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        )
+
+    def test_ban_rechecks_decks_with_card(self):
+        self.client.post('/admin/decklist/bannedcard/add/', {
+            'card': self.remora.id,
+            'note': 'PDH ban list',
+        })
+        self.deck.refresh_from_db()
+        self.assertFalse(self.deck.pdh_legal)
+
+        self.client.post(f'/admin/decklist/bannedcard/{self.remora.id}/delete/', {
+            'post': 'yes',
+        })
+        self.assertFalse(BannedCard.objects.exists())
+        self.deck.refresh_from_db()
+        self.assertTrue(self.deck.pdh_legal)
+
+
+class ColorIdentityTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.colorless = make_card('Colorless')
+        self.green = make_card('Green', identity_g=True)
+        self.blue = make_card('Blue', identity_u=True)
+        self.simic = make_card('Simic', identity_u=True, identity_g=True)
+
+        self.commanders = {}
+        for name, cards in (
+            ('colorless', [self.colorless]),
+            ('green', [self.green]),
+            ('simic', [self.simic]),
+            ('partners', sorted([self.green, self.blue], key=lambda c: c.id)),
+        ):
+            cmdr = Commander.objects.create(commander1=cards[0], commander2=cards[1] if len(cards) > 1 else None)
+            make_deck(name, pdh_legal=True, commander=cmdr)
+            self.commanders[name] = cmdr
+
+    def test_card_identity(self):
+        self.assertEqual(self.colorless.identity, 0)
+        self.assertEqual(self.simic.identity, 2 | 16)
+        self.assertEqual(
+            list(Card.objects.filter(identity=2 | 16)),
+            [self.simic],
+        )
+
+    def test_commander_identity(self):
+        self.assertEqual(self.commanders['green'].identity, 16)
+        self.assertEqual(self.commanders['partners'].identity, 2 | 16)
+        self.assertEqual(self.commanders['partners'].color_identity, 'UG')
+
+    def test_exact_color(self):
+        self.assertEqual(
+            set(Commander.objects.decks_of_exact_color(False, True, False, False, True)),
+            {self.commanders['simic'], self.commanders['partners']},
+        )
+        self.assertEqual(
+            set(Commander.objects.decks_of_exact_color(False, False, False, False, False)),
+            {self.commanders['colorless']},
+        )
+
+    def test_at_least_color(self):
+        self.assertEqual(
+            set(Commander.objects.decks_of_at_least_color(False, False, False, False, True)),
+            {self.commanders['green'], self.commanders['simic'], self.commanders['partners']},
+        )
+        self.assertEqual(
+            Commander.objects.decks_of_at_least_color(False, False, False, False, False).count(),
+            4,
+        )
+
+    def test_refresh_identities(self):
+        Card.objects.filter(pk=self.green.pk).update(identity_w=True)
+        self.assertEqual(Commander.objects.refresh_identities(), 2)
+        self.assertEqual(Commander.objects.refresh_identities(), 0)
+        self.assertEqual(
+            Commander.objects.get(pk=self.commanders['partners'].pk).identity,
+            1 | 2 | 16,
+        )
+
+
+class ThemeEngineTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        elves = [make_card(f'Elf {i}', 'Creature — Elf Druid') for i in range(3)]
+        # typal themes match whole subtypes, not substrings
+        shelf = make_card('Shelf', 'Artifact — Elfshelf')
+        flyers = [make_card(f'Flyer {i}', keywords=['Flying', 'Vigilance']) for i in range(2)]
+
+        self.elf_theme = Theme.objects.create(
+            display_name='Elves', filter_text='Elf', filter_type=Theme.Type.TYPAL,
+            slug='test-elves', card_threshold=2, deck_threshold=50,
+        )
+        self.flying_theme = Theme.objects.create(
+            display_name='Flying', filter_text='Flying', filter_type=Theme.Type.KEYWORD,
+            slug='test-flying', card_threshold=1, deck_threshold=10,
+        )
+
+        elf_lord = make_card('Elf Lord')
+        bird_lord = make_card('Bird Lord')
+        self.elf_cmdr = Commander.objects.create(commander1=elf_lord)
+        self.bird_cmdr = Commander.objects.create(commander1=bird_lord)
+
+        elf_deck = dict(commanders=[elf_lord], commander=self.elf_cmdr, pdh_legal=True)
+        make_deck('elves 1', cards=elves, **elf_deck)
+        make_deck('elves 2', cards=elves, **elf_deck)
+        # not enough elves
+        make_deck('elves 3', cards=elves[:2] + [shelf, shelf], **elf_deck)
+        # illegal decks don't have themes, but count towards the total
+        make_deck('elves 4', cards=elves, **elf_deck | {'pdh_legal': False})
+        # only one deck isn't enough for a theme
+        make_deck('birds', [bird_lord], flyers, commander=self.bird_cmdr, pdh_legal=True)
+
+    def test_compute(self):
+        results = ThemeEngine([self.elf_theme, self.flying_theme]).compute()
+        self.assertEqual(results, {
+            (self.elf_theme.id, self.elf_cmdr.id): (2, 4),
+        })
+
+    def test_compute_for_commanders(self):
+        results = (
+            ThemeEngine([self.elf_theme, self.flying_theme])
+            .compute(Commander.objects.filter(pk=self.bird_cmdr.pk))
+        )
+        self.assertEqual(results, {})
+
+    def test_sync(self):
+        ThemeResult.objects.create(
+            theme=self.elf_theme, commander=self.elf_cmdr,
+            theme_deck_count=1, total_deck_count=1,
+        )
+        ThemeResult.objects.create(
+            theme=self.flying_theme, commander=self.bird_cmdr,
+            theme_deck_count=5, total_deck_count=5,
+        )
+
+        results = ThemeEngine([self.elf_theme, self.flying_theme]).compute()
+        self.assertEqual(ThemeResult.objects.sync(results), (0, 1, 1))
+        self.assertEqual(ThemeResult.objects.sync(results), (0, 0, 0))
+        result = ThemeResult.objects.get()
+        self.assertEqual(
+            (result.theme, result.commander, result.theme_deck_count, result.total_deck_count),
+            (self.elf_theme, self.elf_cmdr, 2, 4),
+        )
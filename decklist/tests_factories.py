@@ -0,0 +1,34 @@
+"""
+Quick ways to make cards and decks for tests.
+"""
+from uuid import uuid4
+
+from crawler.card_parsing import parse_subtypes
+from decklist.models import Card, CardInDeck, Deck
+
+
+def make_card(name, type_line='Creature', **fields):
+    """A card with just enough filled in. Unless told otherwise, it has
+    common and uncommon printings, and subtypes from its type line."""
+    fields = {
+        'subtypes': parse_subtypes(type_line),
+        'has_common_printing': True,
+        'has_uncommon_printing': True,
+    } | fields
+    return Card.objects.create(
+        id=uuid4(),
+        name=name,
+        type_line=type_line,
+        scryfall_uri='https://example.com/',
+        **fields,
+    )
+
+
+def make_deck(name, commanders=(), cards=(), **fields):
+    "A deck with `commanders` in the command zone and `cards` in the 99"
+    deck = Deck.objects.create(name=name, source=0, source_id=name, **fields)
+    CardInDeck.objects.bulk_create(
+        [CardInDeck(deck=deck, card=card, is_pdh_commander=True) for card in commanders]
+        + [CardInDeck(deck=deck, card=card) for card in cards]
+    )
+    return deck
@@ -0,0 +1,135 @@
+import hashlib
+from collections import Counter
+
+from django.db.models import Count, Q, TextField, Value
+from django.db.models.functions import Concat, MD5
+from django.contrib.postgres.aggregates import ArrayAgg, StringAgg
+
+from decklist.models import Card, CardInDeck, Deck, Theme
+
+
+class ThemeEngine:
+    """Works out which commanders have which themes, for every theme at
+    once, in a single pass over legal decks' card lists.
+
+    Which themes each card counts towards is worked out up front, so
+    only cards that count towards some theme are read from the decks."""
+
+    def __init__(self, themes):
+        self.themes = {theme.id: theme for theme in themes}
+        # card ID -> IDs of the themes it counts towards
+        self._card_themes = {}
+        # which cards could count towards some theme
+        self._theme_cards = None
+        self._load()
+
+    def _load(self):
+        subtypes = []
+        keywords = []
+        for theme in self.themes.values():
+            match theme.filter_type:
+                case Theme.Type.TYPAL:
+                    subtypes.append(theme.filter_text)
+                case Theme.Type.KEYWORD:
+                    keywords.append(theme.filter_text)
+                case _:
+                    raise ValueError(f"Not prepared to handle a theme of type {theme.filter_type}")
+
+        # both of these are GIN-indexed, so only candidate cards are read
+        self._theme_cards = Card.objects.filter(
+            Q(subtypes__overlap=subtypes) | Q(keywords__has_any_keys=keywords)
+        )
+        cards = (
+            self._theme_cards
+            .values_list('id', 'subtypes', 'keywords')
+            .iterator(chunk_size=5000)
+        )
+        for card_id, card_subtypes, card_keywords in cards:
+            theme_ids = tuple(
+                theme.id for theme in self.themes.values()
+                if self._matches(theme, card_subtypes, card_keywords)
+            )
+            if theme_ids:
+                self._card_themes[card_id] = theme_ids
+
+    @staticmethod
+    def _matches(theme, subtypes, keywords):
+        if theme.filter_type == Theme.Type.TYPAL:
+            return theme.filter_text in subtypes
+        return theme.filter_text in keywords
+
+    def deck_themes(self, card_ids):
+        "IDs of the themes a deck with these cards (one per CardInDeck) has"
+        counts = Counter(
+            theme_id
+            for card_id in card_ids
+            for theme_id in self._card_themes.get(card_id, ())
+        )
+        return [
+            theme_id for theme_id, count in counts.items()
+            if count > self.themes[theme_id].card_threshold
+        ]
+
+    def fingerprints(self):
+        """{commander ID: fingerprint} of everything a commander's theme
+        results depend on: which decks it has, their legality and card
+        lists, and the themes themselves. Commanders without decks are
+        left out."""
+        themes_key = repr(sorted(
+            (theme.id, theme.filter_type, theme.filter_text, theme.card_threshold, theme.deck_threshold)
+            for theme in self.themes.values()
+        )).encode()
+
+        decks = (
+            Deck.objects
+            .filter(commander__isnull=False)
+            .values('commander_id')
+            .annotate(decks=MD5(StringAgg(
+                Concat('id', Value(':'), 'pdh_legal', Value(':'), 'card_fingerprint', output_field=TextField()),
+                delimiter=';',
+                ordering='id',
+            )))
+            .values_list('commander_id', 'decks')
+        )
+        return {
+            commander_id: hashlib.blake2b(themes_key + decks_hash.encode(), digest_size=16).hexdigest()
+            for commander_id, decks_hash in decks.iterator(chunk_size=5000)
+        }
+
+    def compute(self, commanders=None):
+        """{(theme ID, commander ID): (theme deck count, total deck count)}
+        for every commander with a theme, optionally only among the
+        `commanders` queryset."""
+        theme_decks = Counter()
+        decks = Deck.objects.filter(pdh_legal=True, commander__isnull=False)
+        if commanders is not None:
+            decks = decks.filter(commander__in=commanders)
+
+        rows = (
+            CardInDeck.objects
+            .filter(deck__in=decks, card__in=self._theme_cards)
+            .values('deck_id', 'deck__commander_id')
+            .annotate(cards=ArrayAgg('card_id'))
+            .values_list('deck__commander_id', 'cards')
+        )
+        for commander_id, card_ids in rows.iterator(chunk_size=5000):
+            for theme_id in self.deck_themes(card_ids):
+                theme_decks[theme_id, commander_id] += 1
+
+        all_decks = Deck.objects.filter(commander__isnull=False)
+        if commanders is not None:
+            all_decks = all_decks.filter(commander__in=commanders)
+        total_decks = dict(
+            all_decks
+            .values('commander_id')
+            .annotate(n=Count('id'))
+            .values_list('commander_id', 'n')
+        )
+
+        results = {}
+        for (theme_id, commander_id), count in theme_decks.items():
+            total = total_decks[commander_id]
+            theme = self.themes[theme_id]
+            if count > 1 and count >= total * (theme.deck_threshold / 100.0):
+                results[theme_id, commander_id] = (count, total)
+        return results
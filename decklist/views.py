@@ -27,17 +27,17 @@ def _get_face_card(index):
     except IndexError:
         top_cmdr = None
 
-    if top_cmdr and top_cmdr.commander1.default_printing:
+    if top_cmdr and top_cmdr.commander1.image_uri:
         if top_cmdr.commander2:
             return (
                 top_cmdr.commander1.name,
-                top_cmdr.commander1.default_printing.image_uri,
+                top_cmdr.commander1.image_uri,
                 reverse('card-single-pairings', args=(top_cmdr.commander1.id,)),
             )
         else:
             return (
                 top_cmdr.commander1.name,
-                top_cmdr.commander1.default_printing.image_uri,
+                top_cmdr.commander1.image_uri,
                 reverse('cmdr-single', args=(top_cmdr.sfid,)),
             )
 
@@ -343,7 +343,10 @@ def single_theme(request, theme_slug):
 
 
 def single_card(request, card_id, sort_by_synergy=False):
-    card = get_object_or_404(Card, pk=card_id)
+    card = get_object_or_404(
+        Card.objects.select_related('default_printing'),
+        pk=card_id,
+    )
 
     could_be_in = (
         Commander.objects
@@ -409,7 +412,13 @@ def single_card_pairings(request, card_id):
 
 
 def single_cmdr(request, cmdr_id):
-    cmdr = get_object_or_404(Commander, sfid=cmdr_id)
+    cmdr = get_object_or_404(
+        Commander.objects.select_related(
+            'commander1__default_printing',
+            'commander2__default_printing',
+        ),
+        sfid=cmdr_id,
+    )
 
     if cmdr.commander2:
         identity = {
@@ -609,6 +618,7 @@ def set_editorial_image(request, card_id):
         raise HttpResponseNotAllowed("printing must belong to card")
 
     card.editorial_printing = printing
+    card.set_default_printing()
     card.save()
     
     return HttpResponseClientRefresh()
@@ -5,9 +5,7 @@ cd /app
 set -e
 ./manage fetch-cards
 set +e
-./manage crawl-archidekt --no-stdout
-./manage crawl-moxfield --no-stdout
-./manage get-decklists --no-stdout
+./manage crawl-all --no-stdout
 ./manage compute-commanders --no-stdout
 ./manage compute-themes --no-stdout
 ./manage compute-top-cards --no-stdout
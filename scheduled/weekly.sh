@@ -2,4 +2,5 @@
 
 cd /app
 ./manage compute-synergy --no-stdout
+./manage compute-themes --full --no-stdout
 ./manage update-site-stats
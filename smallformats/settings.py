@@ -31,6 +31,9 @@ SMALLFORMATS_NAME = os.getenv("SMALLFORMATS_NAME", "Nameless Knockoff")
 # SECURITY WARNING: don't leak this
 MOXFIELD_API_KEY = os.environ.get('SMALLFORMATS_MOXFIELD_USERAGENT')
 
+# where fetch-cards keeps downloaded Scryfall bulk files
+BULK_DATA_CACHE_DIR = os.getenv("SMALLFORMATS_BULK_DATA_CACHE_DIR", BASE_DIR / 'bulk-cache')
+
 ALLOWED_HOSTS = [
     '.localhost',
     '127.0.0.1',